@@ -0,0 +1,245 @@
+import argparse
+import hashlib
+import json
+import random
+from datetime import datetime, timedelta
+
+#Generates synthetic GitLab project exports in the same schema as export/*.json, at any size, so the parse phases of the importer
+#can be measured on projects much bigger than our real fixtures. Output is written record by record, so generating a 1M issue
+#export doesn't need it to fit in memory.
+#
+#To use: python3 export-generator.py --issues 100000 --merge-requests 20000 --output ../export/synthetic-100k.json
+
+first_names = ["Misbah", "Caitlin", "Neil", "Noah", "Elsa", "Jens", "Matthieu", "Philip", "Rob", "Shane", "Xin", "Yao", "Kevin", "Nikhil"]
+last_names = ["Mubarak", "Ross", "McGlohon", "Wolfe", "Gonsiorowski", "Domke", "Dorier", "Carns", "Ross", "Snyder", "Wang", "Kang", "Brown", "Jain"]
+words = ("the model network router packet terminal dragonfly torus slim fly workload replay mpi trace rank lp event rollback "
+         "reverse computation simulation config build fails when running with codes ross compile error segfault check "
+         "test latency bandwidth topology routing adaptive minimal nonminimal queue buffer credit flow control").split()
+
+label_catalog = [
+    ("bug", "#D9534F"), ("enhancement", "#428BCA"), ("question", "#69D100"), ("documentation", "#F0AD4E"),
+    ("network-models", "#5843AD"), ("workloads", "#A8D695"), ("build", "#7F8C8D"), ("performance", "#FF0000"),
+]
+
+system_note_templates = [
+    "mentioned in commit {sha}",
+    "mentioned in issue #{ref}",
+    "mentioned in merge request !{ref}",
+    "Status changed to closed",
+    "Status changed to reopened",
+    "closed",
+    "changed title from **{old}** to **{new}**",
+    "changed the description",
+    "added {count} commit{plural}\n\n<ul><li>{short_sha} - {message}</li></ul>",
+    "assigned to @{user}",
+    "added ~{label} label",
+]
+
+
+class Export_Generator:
+    def __init__(self, seed=0, users=40, notes_mean=2.5, body_mean=400, diff_files_mean=6, system_note_fraction=0.45, start=datetime(2014, 1, 1)):
+        self.random = random.Random(seed)
+        self.notes_mean = notes_mean
+        self.body_mean = body_mean
+        self.diff_files_mean = diff_files_mean
+        self.system_note_fraction = system_note_fraction
+        self.start = start
+        self.next_id = 1000
+
+        self.users = []
+        for user_id in range(1, users + 1):
+            first = self.random.choice(first_names)
+            last = self.random.choice(last_names)
+            self.users.append({"id": user_id, "name": "%s %s" % (first, last), "username": (first[0] + last).lower() + str(user_id)})
+
+        self.labels = []
+        for index, (title, color) in enumerate(label_catalog):
+            self.labels.append({"id": index + 1, "title": title, "color": color, "project_id": 68, "created_at": self.timestamp(0),
+                                "updated_at": self.timestamp(0), "template": False, "description": None, "group_id": None,
+                                "type": "ProjectLabel", "priorities": [{"id": index + 1, "project_id": 68, "label_id": index + 1, "priority": index}] if index < 3 else []})
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def timestamp(self, days):
+        return (self.start + timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%S.") + "%03dZ" % self.random.randrange(1000)
+
+    def sha(self):
+        return hashlib.sha1(str(self.random.random()).encode("ascii")).hexdigest()
+
+    def sentence(self, count):
+        return " ".join(self.random.choice(words) for _ in range(count)).capitalize() + "."
+
+    #lognormal-ish body with the things real bodies have in them: code fences, mentions, references and uploads
+    def body(self, mean_size, max_ref):
+        target = max(20, int(self.random.lognormvariate(0, 1) * mean_size * 0.6))
+        parts = []
+        size = 0
+        while size < target:
+            roll = self.random.random()
+            if roll < 0.1:
+                part = "```text\n%s\n%s\n```" % (self.sentence(8), self.sentence(6))
+            elif roll < 0.15:
+                part = "@%s %s" % (self.random.choice(self.users)['username'], self.sentence(6))
+            elif roll < 0.22:
+                part = "See #%d and !%d. %s" % (self.random.randint(1, max_ref), self.random.randint(1, max_ref), self.sentence(5))
+            elif roll < 0.25:
+                part = "![screenshot](/uploads/%s/screenshot-%d.png)" % (self.sha()[:32], self.random.randrange(100))
+            else:
+                part = self.sentence(self.random.randint(6, 20))
+            parts.append(part)
+            size += len(part) + 2
+        return "\n\n".join(parts)
+
+    def note_count(self):
+        #mostly short threads with the occasional very long one
+        if self.random.random() < 0.02:
+            return self.random.randint(20, 120)
+        return min(int(self.random.expovariate(1.0 / self.notes_mean)), 30)
+
+    def note(self, noteable_type, noteable_id, day, max_ref):
+        author = self.random.choice(self.users)
+        system = self.random.random() < self.system_note_fraction
+        if system:
+            template = self.random.choice(system_note_templates)
+            count = self.random.randint(1, 4)
+            text = template.format(sha=self.sha(), short_sha=self.sha()[:8], ref=self.random.randint(1, max_ref), old=self.sentence(3),
+                                   new=self.sentence(3), count=count, plural="s" if count > 1 else "", message=self.sentence(5),
+                                   user=self.random.choice(self.users)['username'], label=self.random.choice(self.labels)['title'])
+        else:
+            text = self.body(self.body_mean / 2, max_ref)
+
+        created_at = self.timestamp(day)
+        return {
+            "id": self.new_id(), "note": text, "noteable_type": noteable_type, "author_id": author['id'],
+            "created_at": created_at, "updated_at": created_at, "project_id": 68,
+            "attachment": {"url": None}, "line_code": None, "commit_id": None, "noteable_id": noteable_id, "system": system,
+            "st_diff": None, "updated_by_id": None, "position": None, "original_position": None, "resolved_at": None,
+            "resolved_by_id": None, "discussion_id": self.sha(), "change_position": None, "resolved_by_push": None,
+            "author": {"name": author['name']}, "events": [],
+        }
+
+    def label_links(self, target_type, target_id, day):
+        links = []
+        for label in self.random.sample(self.labels, self.random.choice((0, 0, 1, 1, 1, 2, 3))):
+            links.append({"id": self.new_id(), "label_id": label['id'], "target_id": target_id, "target_type": target_type,
+                          "created_at": self.timestamp(day), "updated_at": self.timestamp(day), "label": label})
+        return links
+
+    def issue(self, iid, count):
+        record_id = self.new_id()
+        day = iid * 1500.0 / count
+        state = "closed" if self.random.random() < 0.7 else "opened"
+        closed_at = self.timestamp(day + self.random.randint(1, 90)) if state == "closed" and self.random.random() < 0.8 else None
+        notes = [self.note("Issue", record_id, day + index * 0.5, count) for index in range(self.note_count())]
+
+        return {
+            "id": record_id, "title": self.sentence(self.random.randint(3, 9))[:-1], "author_id": self.random.choice(self.users)['id'],
+            "project_id": 68, "created_at": self.timestamp(day), "updated_at": notes[-1]['updated_at'] if notes else None,
+            "description": self.body(self.body_mean, count), "state": state, "iid": iid, "updated_by_id": None, "confidential": False,
+            "moved_to_id": None, "due_date": None, "lock_version": None, "time_estimate": 0, "relative_position": None,
+            "last_edited_at": None, "last_edited_by_id": None, "discussion_locked": None, "closed_at": closed_at, "closed_by_id": None,
+            "events": [], "timelogs": [], "notes": notes, "label_links": self.label_links("Issue", record_id, day),
+            "resource_label_events": [], "issue_assignees": [],
+        }
+
+    def diff_files(self, diff_id):
+        files = []
+        for order in range(max(1, int(self.random.expovariate(1.0 / self.diff_files_mean)))):
+            path = "src/%s/%s.c" % (self.random.choice(words), self.random.choice(words))
+            lines = ["--- a/%s" % path, "+++ b/%s" % path]
+            for hunk in range(self.random.randint(1, 5)):
+                start = self.random.randint(1, 2000)
+                lines.append("@@ -%d,7 +%d,8 @@" % (start, start))
+                for line in range(self.random.randint(3, 30)):
+                    lines.append(self.random.choice(" +-") + "    " + self.sentence(self.random.randint(2, 8)))
+            files.append({"merge_request_diff_id": diff_id, "relative_order": order, "new_file": False, "renamed_file": False,
+                          "deleted_file": False, "too_large": False, "a_mode": "100644", "b_mode": "100644", "new_path": path,
+                          "old_path": path, "binary": False, "utf8_diff": "\n".join(lines) + "\n"})
+        return files
+
+    def merge_request(self, iid, count):
+        record_id = self.new_id()
+        day = iid * 1500.0 / count
+        roll = self.random.random()
+        state = "merged" if roll < 0.6 else "closed" if roll < 0.8 else "opened"
+        author = self.random.choice(self.users)
+        notes = [self.note("MergeRequest", record_id, day + index * 0.3, count) for index in range(self.note_count())]
+        commits = [{"authored_date": self.timestamp(day), "committed_date": self.timestamp(day), "merge_request_diff_id": record_id,
+                    "relative_order": order, "sha": self.sha(), "author_name": author['name'], "author_email": "%s@example.org" % author['username'],
+                    "committer_name": author['name'], "committer_email": "%s@example.org" % author['username'], "message": self.sentence(6) + "\n"}
+                   for order in range(self.random.randint(1, 10))]
+
+        return {
+            "id": record_id, "target_branch": "master", "source_branch": "%s-%d" % (self.random.choice(words), iid), "source_project_id": 68,
+            "author_id": author['id'], "assignee_id": None, "title": self.sentence(self.random.randint(3, 9))[:-1],
+            "created_at": self.timestamp(day), "updated_at": notes[-1]['updated_at'] if notes else self.timestamp(day), "state": state,
+            "merge_status": "can_be_merged", "target_project_id": 68, "iid": iid, "description": self.body(self.body_mean, count),
+            "updated_by_id": None, "merge_error": None, "merge_params": {"force_remove_source_branch": None}, "merge_when_pipeline_succeeds": False,
+            "merge_user_id": None, "merge_commit_sha": self.sha() if state == "merged" else None, "in_progress_merge_commit_sha": None,
+            "lock_version": None, "time_estimate": 0, "last_edited_at": None, "last_edited_by_id": None, "head_pipeline_id": None,
+            "discussion_locked": None, "rebase_commit_sha": None, "allow_maintainer_to_push": None, "squash": False,
+            "diff_head_sha": commits[0]['sha'], "source_branch_sha": None, "target_branch_sha": self.sha(),
+            "metrics": {"id": record_id, "merge_request_id": record_id, "merged_at": None, "created_at": self.timestamp(day)},
+            "notes": notes,
+            "merge_request_diff": {"id": record_id, "state": "collected", "merge_request_id": record_id, "created_at": self.timestamp(day),
+                                   "updated_at": self.timestamp(day), "base_commit_sha": self.sha(), "real_size": str(len(commits)),
+                                   "head_commit_sha": commits[0]['sha'], "start_commit_sha": self.sha(), "commits_count": len(commits),
+                                   "merge_request_diff_commits": commits, "merge_request_diff_files": self.diff_files(record_id)},
+            "events": [], "timelogs": [], "label_links": self.label_links("MergeRequest", record_id, day), "resource_label_events": [],
+        }
+
+    def project_members(self):
+        for user in self.users:
+            yield {"id": self.new_id(), "access_level": 30, "source_id": 68, "source_type": "Project", "user_id": user['id'],
+                   "notification_level": 3, "created_at": self.timestamp(0), "updated_at": self.timestamp(0),
+                   "user": {"id": user['id'], "email": "%s@example.org" % user['username'], "username": user['username']}}
+
+    #write a project.json style export - the arrays are written one record at a time
+    def write(self, f, issue_count, mr_count):
+        f.write('{"description": "Synthetic CODES export", "visibility_level": 20, "archived": false,\n')
+        f.write('"labels": %s,\n' % json.dumps(self.labels))
+
+        self.write_array(f, "project_members", self.project_members())
+        f.write(",\n")
+        self.write_array(f, "issues", (self.issue(iid, issue_count) for iid in range(1, issue_count + 1)))
+        f.write(",\n")
+        self.write_array(f, "merge_requests", (self.merge_request(iid, mr_count) for iid in range(1, mr_count + 1)))
+        f.write(',\n"ci_pipelines": [], "protected_branches": []}\n')
+
+    @staticmethod
+    def write_array(f, key, records):
+        f.write('"%s": [' % key)
+        for index, record in enumerate(records):
+            if index:
+                f.write(",\n")
+            f.write(json.dumps(record))
+        f.write("]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic GitLab project export")
+    parser.add_argument("--issues", type=int, default=1000)
+    parser.add_argument("--merge-requests", type=int, default=None, help="defaults to a fifth of --issues")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--notes-mean", type=float, default=2.5, help="average notes per issue/MR")
+    parser.add_argument("--body-mean", type=int, default=400, help="average description size in characters")
+    parser.add_argument("--diff-files-mean", type=float, default=6, help="average changed files per MR")
+    parser.add_argument("--system-note-fraction", type=float, default=0.45)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="synthetic-project.json")
+    args = parser.parse_args()
+
+    mr_count = args.merge_requests if args.merge_requests is not None else args.issues // 5
+    generator = Export_Generator(seed=args.seed, users=args.users, notes_mean=args.notes_mean, body_mean=args.body_mean,
+                                 diff_files_mean=args.diff_files_mean, system_note_fraction=args.system_note_fraction)
+
+    print("Generating %d issues and %d merge requests into %s..." % (args.issues, mr_count, args.output))
+    with open(args.output, "w") as f:
+        generator.write(f, args.issues, mr_count)
+    print("Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+from time import sleep, monotonic
+
+from script_loader import load_script
+
+#End-to-end throughput benchmark for joint-importer.py. Starts mock-github-server.py in its own process, points the importer at it
+#and runs the full main() flow on the export fixtures, then reports items/sec, request latency percentiles and the importer's peak RSS.
+#
+#To use: python3 importer-benchmark.py [--latency 0.05] [--max-rate 50] [--reorder 5] ...
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+export_dir = os.path.join(script_dir, "..", "export")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, port):
+    command = [sys.executable, os.path.join(script_dir, "mock-github-server.py"), "--port", str(port),
+               "--latency", str(args.latency), "--jitter", str(args.jitter), "--process-delay", str(args.process_delay),
+               "--reorder", str(args.reorder), "--quota", str(args.quota), "--quota-window", str(args.quota_window),
+               "--secondary-per-second", str(args.secondary_per_second), "--error-rate", str(args.error_rate)]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = monotonic() + 10
+    while monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return server
+        except OSError:
+            sleep(0.05)
+    server.kill()
+    raise RuntimeError("mock GitHub server did not start")
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+#wraps the importer's session so every HTTP round trip is timed
+def instrument(transport, samples):
+    send = transport.session.request
+
+    def timed_request(method, url, **kwargs):
+        start = monotonic()
+        response = send(method, url, **kwargs)
+        samples.append((method, url, response.status_code, monotonic() - start))
+        return response
+
+    transport.session.request = timed_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run joint-importer.py end to end against the mock GitHub server")
+    parser.add_argument("--issues", default=os.path.join(export_dir, "issues.json"))
+    parser.add_argument("--merges", default=os.path.join(export_dir, "merges-sample.json"))
+    parser.add_argument("--project", default=None, help="export used to find author names (defaults to --issues)")
+    parser.add_argument("--max-rate", type=float, default=200.0, help="importer rate limiter ceiling, requests/sec")
+    parser.add_argument("--burst", type=int, default=20, help="importer rate limiter burst")
+    parser.add_argument("--window", type=int, default=None, help="issue imports in flight (default: IMPORT_WINDOW)")
+    parser.add_argument("--pool-size", type=int, default=None, help="HTTP pool size (default: HTTP_POOL_SIZE)")
+    parser.add_argument("--status-interval", type=float, default=0.1, help="seconds between import status polls")
+    parser.add_argument("--retry-base-delay", type=float, default=0.05, help="importer backoff before the first retry of a failed request")
+    parser.add_argument("--circuit-cooldown", type=float, default=1.0, help="seconds the importer's circuit breaker pauses sending for")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--process-delay", type=float, default=0.01)
+    parser.add_argument("--reorder", type=int, default=0)
+    parser.add_argument("--quota", type=int, default=5000)
+    parser.add_argument("--quota-window", type=int, default=3600)
+    parser.add_argument("--secondary-per-second", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true", help="show the importer's own output")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(args, port)
+    workdir = tempfile.mkdtemp(prefix="importer-benchmark-")
+
+    os.environ.setdefault("GH_TOKEN", "benchmark")
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+
+    try:
+        importer = load_script("joint-importer.py", "joint_importer")
+        importer.PROJECT_FILE = args.project or args.issues
+        importer.ISSUES_FILE = args.issues
+        importer.MERGES_FILE = args.merges
+        importer.JOURNAL_FILE = os.path.join(workdir, "import-journal.sqlite3")
+        importer.REFERENCE_INDEX_FILE = os.path.join(workdir, "reference-index.json")
+        if args.window is not None:
+            importer.IMPORT_WINDOW = args.window
+        importer.import_tracker.interval = args.status_interval
+
+        limiter = importer.Rate_Limiter(max_rate=args.max_rate, burst=args.burst)
+        importer.github_transport = importer.GitHub_Transport("benchmark", api_url="http://127.0.0.1:%d" % port,
+                                                              pool_size=args.pool_size or importer.HTTP_POOL_SIZE, limiter=limiter,
+                                                              retry_policy=importer.Retry_Policy(base_delay=args.retry_base_delay),
+                                                              breaker=importer.Circuit_Breaker(cooldown=args.circuit_cooldown))
+        importer.input = lambda prompt: "proceed"
+
+        samples = []
+        instrument(importer.github_transport, samples)
+
+        start = monotonic()
+        importer.main()
+        elapsed = monotonic() - start
+    finally:
+        if not args.verbose:
+            sys.stdout.close()
+        sys.stdout = stdout
+        server.terminate()
+        server.wait()
+
+    entries = importer.import_journal.entries
+    sent = sum(1 for status, number, import_id, payload_hash in entries.values() if status in importer.Import_Journal.done_states)
+    failed = sum(1 for status, number, import_id, payload_hash in entries.values() if status == "failed")
+    unknown = sum(1 for status, number, import_id, payload_hash in entries.values() if status == "unknown")
+    latencies = [latency for method, url, status_code, latency in samples]
+    posts = [latency for method, url, status_code, latency in samples if method == "POST"]
+    polls = [latency for method, url, status_code, latency in samples if method == "GET"]
+
+    print("Items sent:       %d (%d failed, %d unknown)" % (sent, failed, unknown))
+    print("Elapsed:          %.2f s" % elapsed)
+    print("Throughput:       %.1f items/s" % (sent / elapsed if elapsed > 0 else 0.0))
+    print("HTTP requests:    %d (%d POST, %d status polls, %d non-2xx)" % (len(samples), len(posts), len(polls),
+          sum(1 for method, url, status_code, latency in samples if status_code >= 300 and status_code != 304)))
+    print("Latency p50/p99:  %.1f / %.1f ms (POST %.1f / %.1f ms)" % (percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+          percentile(posts, 0.5) * 1000, percentile(posts, 0.99) * 1000))
+    print("Peak RSS:         %.1f MB" % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+    importer.github_transport.stats.report(importer.github_transport.breaker)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,115 @@
+import argparse
+import asyncio
+import calendar
+import codecs
+import copy
+import gzip
+import hashlib
 import json
+import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError
 import os
-from time import sleep
+import queue
+import random
+import sqlite3
+import subprocess
+import tarfile
+import threading
+import urllib.parse
+from time import sleep, time, monotonic
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    import zstandard #only needed to read .zst exports
+except ImportError:
+    zstandard = None
 
 issues_base_url = "https://xgitlab.cels.anl.gov/codes/codes/issues/" #This is the base URL for old GitLab Issues
 mr_base_url = "https://xgitlab.cels.anl.gov/codes/codes/merge_requests/" #This is the base URL for old GitLab MR
+project_base_url = "https://xgitlab.cels.anl.gov/codes/codes" #This is the old GitLab project itself - used to fix up relative links
 
 GH_OWNER = "codes-org"
 GH_REPO = "test-codes"
 
 print("Loading GitHub Personal Access Token")
 GH_TOKEN = os.environ["GH_TOKEN"] #make sure you export your own github api personal acess token to your command line
-print("Success\n")
+#more tokens with access to the repo can be exported as a comma separated GH_TOKENS - each has its own quota, and requests go to whichever has the most left
+GH_TOKENS = [GH_TOKEN] + [token for token in os.environ.get("GH_TOKENS", "").split(",") if token and token != GH_TOKEN]
+print("Success (%d token%s)\n" % (len(GH_TOKENS), "s" if len(GH_TOKENS) > 1 else ""))
+
+PROJECT_FILE = "../export/project.json" #full project export - authors, issues and merge requests are all read from it in one pass
+ISSUES_FILE = None #set to e.g. "../export/issues.json" to take the issues from a separately extracted file instead
+MERGES_FILE = None #set to e.g. "../export/merges.json" to take the merge requests from a separately extracted file instead
+AUTHOR_CACHE_SUFFIX = ".authors.json" #the author index found in PROJECT_FILE is cached next to it so reruns don't have to scan for it
+EXPORT_INDEX_SUFFIX = ".index.json" #where each issue and MR is in an export file, kept next to it so --iids and --failed-from only read those records
+PARSE_WORKERS = 0 #processes used to parse issues and merge requests - 0 or 1 parses them in this process
+PARSE_CHUNK_SIZE = 200 #records handed to a parse worker at a time
+
+GH_API_URL = "https://api.github.com"
+GH_WEB_URL = "https://github.com" #used for the new URLs in the reference index
+HTTP_POOL_SIZE = 10 #number of keep-alive connections kept open to the GitHub API
+GH_BODY_LIMIT = 65536 #characters GitHub accepts in one issue, pull request or comment body
+GH_IMPORT_PAYLOAD_LIMIT = 1 << 20 #bytes of issue import sent in one request - comments past this are posted separately afterwards
+
+#Accept header each GitHub endpoint we use expects - add new endpoints here so they go through the shared transport
+GH_ENDPOINT_ACCEPT = {
+    "import_issues": "application/vnd.github.golden-comet-preview+json",
+    "pulls": "application/vnd.github.sailor-v-preview+json",
+    "issue_comments": "application/vnd.github.sailor-v-preview+json",
+    "issues": "application/vnd.github.v3+json",
+    "labels": "application/vnd.github.v3+json",
+}
+
+#Requests are paced by a token bucket that adapts to the rate limit headers GitHub sends back, instead of fixed sleeps
+RATE_LIMIT_MAX_PER_SECOND = 1.0 #ceiling on the request rate per token, even when the remaining quota would allow more
+RATE_LIMIT_BURST = 5 #how many requests can go out back to back after an idle period
+RATE_LIMIT_SECONDARY_BACKOFF = 60 #seconds to pause on a secondary (abuse detection) limit that doesn't say how long to wait
+RATE_LIMIT_MAX_RETRIES = 5 #how many times a request GitHub rate limited is resent after backing off
+
+#Server errors and dropped connections are retried with jittered exponential backoff, and a circuit breaker stops all sending for a while
+#when most recent requests are failing (e.g. a GitHub outage) instead of failing the rest of the list one request at a time
+HTTP_TIMEOUT = 60 #seconds to wait on GitHub before giving up on a request (and retrying it)
+RETRY_MAX_ATTEMPTS = 5 #how many times a request that failed with a retryable error is resent
+RETRY_BASE_DELAY = 1.0 #backoff before the first retry, doubled every retry after that - the actual wait is random between 0 and this
+RETRY_MAX_DELAY = 60.0 #the backoff stops doubling here
+RETRY_STATUS_CODES = (500, 502, 503, 504) #statuses worth sending again - any other error is the request's own fault and won't get better
+CIRCUIT_WINDOW = 20 #how many of the latest requests the circuit breaker looks at
+CIRCUIT_FAILURE_RATIO = 0.5 #the breaker opens when at least this share of them failed
+CIRCUIT_COOLDOWN = 30.0 #seconds nothing is sent once it opens, before one trial request decides whether to carry on
+
+IMPORT_WINDOW = 1 #how many issue imports can be waiting on GitHub to be processed at once - 1 keeps them numbered in orig_issue_id order, more is faster but gives that up (see import_github_issues)
+IMPORT_STATUS_INTERVAL = 1.0 #seconds between polls of the import statuses while any import is still pending
+IMPORT_STATUS_MAX_FAILURES = 5 #failed polls of the import listing in a row before each import's own status is polled instead, and failed polls of that before the import is given up on for this run
+IMPORT_STATUS_TIMEOUT = 600.0 #seconds an import can stay pending before it is given up on for this run (the next run checks it again)
+IMPORT_RESOLVE_ATTEMPTS = 10 #polls of an import left unfinished by an earlier run, before it is skipped until the next run
+IMPORT_CLOSED_MRS_AS_ISSUES = True #closed and merged MRs are imported as closed issues with their notes as comments, one request each
+IMPORT_LABELS = True #labels are created on GitHub before anything is imported (priorities go in their description) and set on the issues they were on
+LABEL_DEFAULT_COLOR = "ededed" #for a label whose GitLab color isn't a plain hex color
+
+JOURNAL_FILE = "import-journal.sqlite3" #records what has been sent so a crashed or interrupted run can be resumed without duplicates
+JOURNAL_FLUSH_SIZE = 50 #journal entries buffered before they are written to disk
+JOURNAL_FLUSH_SECONDS = 5.0 #...or after this long, whichever comes first
+
+BODY_REWRITE_RULES = ("fences",) #rewrites applied to every body (see body_rewrite_rules) - "mentions" and "uploads" are also available
+#What happens to each category of GitLab system note (see system_note_categories) while parsing: "keep", "drop", or "collapse" a run of
+#consecutive ones into one note. Categories not listed are kept; "duplicate" is a note repeating the previous one word for word.
+SYSTEM_NOTE_ACTIONS = {"commit_mentions": "collapse", "commits": "collapse", "description": "drop", "duplicate": "drop"}
+REWRITE_REFERENCES = True #point #123 and !45 references in bodies at the GitHub numbers those issues and merge requests were imported as
+REFERENCE_INDEX_FILE = "reference-index.json" #old GitLab number -> new GitHub number lookup written at the end of a run, e.g. for redirects
+
+ATTACHMENT_TARGET = None #where files linked as /uploads/... are rehosted: a directory, or "git:<path>" for a git repository they are committed to - None leaves the links alone
+ATTACHMENT_BASE_URL = None #the URL ATTACHMENT_TARGET is served from, e.g. "https://raw.githubusercontent.com/codes-org/attachments/main" - a directory defaults to its file:// URL
+UPLOADS_DIR = None #the export's uploads directory - defaults to "uploads" next to PROJECT_FILE, or the one inside it when PROJECT_FILE is an archive
+ATTACHMENT_CACHE_FILE = "attachment-cache.json" #content hash -> URL of every file rehosted so far, so reruns never upload the same bytes twice
+ATTACHMENT_WORKERS = 8 #files stored at the same time
+
+STREAM_CHUNK_SIZE = 1 << 20 #how many characters of an export file are read at a time while streaming records out of it
+STREAM_READ_AHEAD = 4 #chunks of a compressed export decompressed ahead of the parser, on a thread of its own
+EXPORT_ARCHIVE_MEMBER = "project.json" #the file read out of a .tar.gz project export - export files can also be .json.gz or .json.zst
 
 #GLOBAL VARIABLES -------------------
 
@@ -19,18 +117,679 @@ author_id_map = {} # maps user ID numbers to full names
 secondary_author_id_map = {} #uses user names instead of full name
 
 
+#BODY REWRITING -------------------------------------------------------------------------
+
+#One rewrite rule for note/issue/MR bodies: `replacement` is either a fixed string or a function taking the matched text.
+#Rules marked outside_code are not applied inside `inline code` or ```fenced blocks```. Patterns should start with a literal character
+#(put lookbehinds after it) - that lets the combined pattern jump straight to candidate positions instead of trying every rule everywhere.
+class Rewrite_Rule:
+    __slots__ = ('name', 'pattern', 'replacement', 'outside_code')
+
+    def __init__(self, name, pattern, replacement, outside_code=False):
+        self.name = name
+        self.pattern = pattern
+        self.replacement = replacement
+        self.outside_code = outside_code
+
+body_rewrite_rules = {} #every rule available to BODY_REWRITE_RULES, by name
+
+def add_rewrite_rule(name, pattern, replacement, outside_code=False):
+    body_rewrite_rules[name] = Rewrite_Rule(name, pattern, replacement, outside_code)
+
+#GitLab's ```text fences just show up as a language called "text" on GitHub
+add_rewrite_rule("fences", r'```text', "```")
+#@username would notify whoever owns that name on GitHub - quote it instead
+add_rewrite_rule("mentions", r'@(?<![\w`@]@)[A-Za-z0-9_](?:[A-Za-z0-9_.-]*[A-Za-z0-9_])?', lambda text: "`%s`" % text, outside_code=True)
+#attachments are linked relative to the GitLab project, which means nothing on GitHub - point them back at GitLab
+add_rewrite_rule("uploads", r'/(?<=\]\(/)uploads/', lambda text: project_base_url + text)
+
+#Applies all the active rules to a body in a single pass: they are compiled into one alternation and each match is dispatched to the
+#rule that matched it (found from an empty marker group at the end of each alternative), so adding a rule doesn't add another scan over
+#every body. If any rule has to stay out of code, code spans are matched as one more alternative and only the rules allowed inside code
+#are run over them.
+class Body_Rewriter:
+    code_pattern = r'```.*?```|`[^`\n]+`'
+
+    #rules are given by name (from body_rewrite_rules) or as Rewrite_Rule objects
+    def __init__(self, rules):
+        rules = [body_rewrite_rules[rule] if type(rule) is str else rule for rule in rules]
+        self.replacements = dict((rule.name, rule.replacement) for rule in rules)
+
+        alternatives = []
+        self.inside_code = None
+        if any(rule.outside_code for rule in rules):
+            alternatives.append("(?:%s)(?P<code>)" % self.code_pattern)
+            code_rules = [rule for rule in rules if not rule.outside_code]
+            if code_rules:
+                self.inside_code = Body_Rewriter(code_rules)
+
+        for rule in rules:
+            alternatives.append("(?:%s)(?P<%s>)" % (rule.pattern, rule.name))
+
+        self.regex = None
+        if alternatives:
+            self.regex = re.compile("|".join(alternatives), re.DOTALL)
+
+        #a single plain string swap (the default) is quicker as a str.replace
+        self.literal = None
+        if len(rules) == 1 and not rules[0].outside_code and type(rules[0].replacement) is str and re.escape(rules[0].pattern) == rules[0].pattern:
+            self.literal = (rules[0].pattern, rules[0].replacement)
+
+    def dispatch(self, match):
+        name = match.lastgroup
+        text = match.group()
+
+        if name == "code":
+            if self.inside_code is None:
+                return text
+            return self.inside_code.rewrite(text)
+
+        replacement = self.replacements[name]
+        if type(replacement) is str:
+            return replacement
+        return replacement(text)
+
+    def rewrite(self, text):
+        if self.literal is not None:
+            return text.replace(*self.literal)
+        if self.regex is None:
+            return text
+        return self.regex.sub(self.dispatch, text)
+
+body_rewriter = Body_Rewriter(BODY_REWRITE_RULES) #shared by Note, Issue and Merge_Request
+
+#A body or comments that went out while an issue/MR they reference had no GitHub number yet, with the text as it was sent
+class Reference_Patch:
+    __slots__ = ('record', 'imported', 'body', 'comments')
+
+    def __init__(self, record):
+        self.record = record
+        self.imported = False #sent through the issue import api (to_import_json) rather than created as a pull request (to_json)
+        self.body = None
+        self.comments = [] #(note, body as sent, GitHub comment id, None) for posted comments, (None, body as sent, None, position) for imported ones
+
+#Maps original GitLab issue and MR numbers to the GitHub numbers they were imported as. #123 and !45 in a body are rewritten from it when
+#the body is serialized (not when it's parsed - most numbers aren't known then), in the same single pass engine as the other rules.
+#A reference to something in the export that has no number yet links back to GitLab and counts as unresolved: whatever was sent with
+#one is remembered in `patches` so patch_github_references() can fix it once everything has been imported.
+class Reference_Index:
+    def __init__(self):
+        self.numbers = {"issue": {}, "mr": {}} #kind -> orig id (str) -> GitHub number, None until it is known
+        self.patches = {} #record key -> Reference_Patch
+        self.local = threading.local() #unresolved reference count of the serialization running on this thread
+        self.lock = threading.Lock()
+        self.rewriter = Body_Rewriter((
+            Rewrite_Rule("issue_refs", r'#(?<![\w&#/]#)\d+\b', lambda text: self.reference(self.numbers["issue"], "#", issues_base_url, text[1:]), outside_code=True),
+            Rewrite_Rule("mr_refs", r'!(?<![\w!]!)\d+\b', lambda text: self.reference(self.numbers["mr"], "!", mr_base_url, text[1:]), outside_code=True),
+        ))
+
+    #everything in the export, so references to it can be told apart from references to things that were never exported
+    def expect(self, records):
+        self.expect_keys(record.key for record in records)
+
+    def expect_keys(self, keys):
+        for kind, orig_id in keys:
+            self.numbers[kind].setdefault(str(orig_id), None)
+
+    def add(self, kind, orig_id, number):
+        self.numbers[kind][str(orig_id)] = number
+
+    def reference(self, numbers, sigil, base_url, orig_id):
+        number = numbers.get(orig_id)
+        if number is not None:
+            return "#%d" % number
+        if orig_id in numbers:
+            self.local.unresolved = getattr(self.local, 'unresolved', 0) + 1
+        return "[%s%s](%s%s)" % (sigil, orig_id, base_url, orig_id)
+
+    def rewrite(self, text):
+        if not REWRITE_REFERENCES:
+            return text
+        return self.rewriter.rewrite(text)
+
+    #calls function and returns (its result, how many references it rewrote that couldn't be resolved yet)
+    def count_unresolved(self, function, *args):
+        self.local.unresolved = 0
+        result = function(*args)
+        return result, self.local.unresolved
+
+    def patch_for(self, record):
+        with self.lock:
+            patch = self.patches.get(record.key)
+            if patch is None:
+                patch = self.patches[record.key] = Reference_Patch(record)
+            return patch
+
+    #remember what a record was sent as when it had unresolved references - taken from the payload itself, since other numbers may have
+    #come in since it was serialized. Imports carry their comments, pull requests don't.
+    def defer(self, record, data):
+        patch = self.patch_for(record)
+        data = json.loads(data)
+        if 'issue' in data:
+            patch.imported = True
+            patch.body = data['issue']['body']
+            for position, comment in enumerate(data['comments']):
+                patch.comments.append((None, comment['body'], None, position))
+        else:
+            patch.body = data['body']
+
+    def defer_comment(self, record, note, body, comment_id):
+        self.patch_for(record).comments.append((note, body, comment_id, None))
+
+    #the lookup from old numbers to new ones, plus old URL -> new URL pairs ready to be turned into redirects
+    def save(self, filename):
+        repo_url = "%s/%s/%s" % (GH_WEB_URL, GH_OWNER, GH_REPO)
+        lookup = {"issues": {}, "merge_requests": {}, "redirects": {}}
+
+        for orig_id, number in self.numbers["issue"].items():
+            if number is not None:
+                lookup["issues"][orig_id] = number
+                lookup["redirects"][issues_base_url + orig_id] = "%s/issues/%d" % (repo_url, number)
+        for orig_id, number in self.numbers["mr"].items():
+            if number is not None:
+                lookup["merge_requests"][orig_id] = number
+                lookup["redirects"][mr_base_url + orig_id] = "%s/pull/%d" % (repo_url, number)
+
+        with open(filename + ".partial", "w") as f:
+            json.dump(lookup, f, indent=1, sort_keys=True)
+        os.replace(filename + ".partial", filename)
+        print("Wrote %d issue and %d merge request numbers to %s" % (len(lookup["issues"]), len(lookup["merge_requests"]), filename))
+
+reference_index = Reference_Index() #filled in as github assigns numbers
+
+#SYSTEM NOTES ---------------------------------------------------------------------------
+
+#GitLab records its own activity ("mentioned in commit ...", "changed the description", "added 2 commits") as notes flagged `system`.
+#Each one goes in the first category below whose pattern matches the start of its text, or "other", and SYSTEM_NOTE_ACTIONS says what
+#happens to that category. A note that repeats the one kept just before it, same author and same text, is a "duplicate" whatever it is.
+system_note_categories = [] #(name, compiled pattern, summarize), tried in order
+
+#summarize turns the texts of a run of collapsed notes into the text of the single note that replaces them - by default they're put together
+def add_system_note_category(name, pattern, summarize=None):
+    system_note_categories.append((name, re.compile(pattern), summarize))
+
+def summarize_commit_mentions(texts):
+    return "mentioned in commits " + ", ".join(re.sub(r'^[Mm]entioned in commit ', '', text) for text in texts)
+
+add_system_note_category("commit_mentions", r'[Mm]entioned in commit ', summarize_commit_mentions)
+add_system_note_category("mentions", r'[Mm]entioned in ')
+add_system_note_category("commits", r'added \d+ (?:new )?commits?\b')
+add_system_note_category("status", r'Status changed to |(?:closed|reopened|merged)\b')
+add_system_note_category("title", r'[Cc]hanged title ')
+add_system_note_category("description", r'[Cc]hanged the description')
+add_system_note_category("assignee", r'(?:[Rr]e)?[Aa]ssigned to |[Uu]nassigned |[Rr]emoved assignee')
+add_system_note_category("labels", r'(?:added|removed) ~')
+add_system_note_category("milestone", r'(?:[Cc]hanged|[Rr]emoved) milestone')
+add_system_note_category("branch", r'(?:created|deleted|restored) (?:source )?branch')
+
+#Runs while issues and MRs are parsed, so dropped notes are never built, sent or kept in memory. Counts what every category removed:
+#notes, bytes of comment body, and requests - a pull request's notes are posted one request each, an import's all go in the one request.
+class System_Note_Filter:
+    def __init__(self, actions=SYSTEM_NOTE_ACTIONS):
+        self.actions = actions
+        self.counts = {} #category -> [notes removed, bytes removed, requests saved]
+
+    def reset(self):
+        self.counts = {}
+
+    def merge(self, counts):
+        for category, (notes, size, requests) in counts.items():
+            total = self.counts.setdefault(category, [0, 0, 0])
+            total[0] += notes
+            total[1] += size
+            total[2] += requests
+
+    def count(self, category, size, requests):
+        total = self.counts.setdefault(category, [0, 0, 0])
+        total[0] += 1
+        total[1] += size
+        total[2] += requests
+
+    def classify(self, note_json):
+        if not note_json.get('system'):
+            return None
+        for name, pattern, summarize in system_note_categories:
+            if pattern.match(note_json['note']):
+                return name
+        return "other"
+
+    #returns (author name, timestamp, text, note id) for every note that is left, in order
+    def filter(self, notes_raw, posted_separately=False):
+        kept = []
+        run = None #(category, summarize, texts) of the collapsed run that kept[-1] stands for
+        for note_json in notes_raw:
+            author = note_json['author']['name']
+            text = note_json['note']
+
+            category = self.classify(note_json)
+            if kept and kept[-1][0] == author and kept[-1][2] == text:
+                category = "duplicate"
+            action = self.actions.get(category, "keep")
+
+            if action == "drop":
+                self.count(category, len(("**%s**:\n\n" % author + text).encode("utf-8")), 1 if posted_separately else 0)
+                continue
+
+            if action == "collapse" and run is not None and run[0] == category:
+                run[2].append(text)
+                summary = run[1](run[2]) if run[1] is not None else "\n\n".join(run[2])
+                previous = kept[-1]
+                kept[-1] = (previous[0], previous[1], summary, previous[3])
+                self.count(category, len(("**%s**:\n\n" % author + text + previous[2]).encode("utf-8")) - len(summary.encode("utf-8")), 1 if posted_separately else 0)
+                continue
+
+            run = None
+            if action == "collapse":
+                summarize = [entry[2] for entry in system_note_categories if entry[0] == category]
+                run = (category, summarize[0] if summarize else None, [text])
+            kept.append((author, note_json['updated_at'], text, note_json.get('id')))
+
+        return kept
+
+    def report(self):
+        if not self.counts:
+            return
+        print("System and duplicate notes removed:")
+        for category, (notes, size, requests) in sorted(self.counts.items()):
+            print("\t%-16s %7d notes %10d bytes %7d requests" % (category, notes, size, requests))
+        notes, size, requests = [sum(counts[i] for counts in self.counts.values()) for i in range(3)]
+        print("\t%-16s %7d notes %10d bytes %7d requests\n" % ("total", notes, size, requests))
+
+system_note_filter = System_Note_Filter() #shared by parse_issue and parse_mr
+
+#LABELS ---------------------------------------------------------------------------------
+
+#GitLab puts a copy of the label in every label link of an issue or MR. The catalog collects them while the export is streamed, so each
+#label is created on GitHub once and up front, and the issues themselves only carry label names.
+class Label_Catalog:
+    hex_color = re.compile(r'#?([0-9a-fA-F]{6})\Z')
+
+    def __init__(self):
+        self.labels = {} #lowercased name (GitHub's are case insensitive) -> [name, color, description, priority]
+
+    def add(self, label):
+        name = label.get('title')
+        if not name:
+            return
+
+        priorities = [priority['priority'] for priority in label.get('priorities') or () if priority.get('priority') is not None]
+        priority = min(priorities) if priorities else None
+
+        entry = self.labels.get(name.lower())
+        if entry is None:
+            color = self.hex_color.match(str(label.get('color')))
+            self.labels[name.lower()] = [name, color.group(1).lower() if color else LABEL_DEFAULT_COLOR, label.get('description') or "", priority]
+        elif priority is not None and (entry[3] is None or priority < entry[3]):
+            entry[3] = priority
+
+    def add_links(self, item):
+        for link in item.get('label_links') or ():
+            if link.get('label'):
+                self.add(link['label'])
+
+    #labels not in existing (lowercased names), highest priority first
+    def missing(self, existing):
+        return sorted((entry for key, entry in self.labels.items() if key not in existing),
+                      key=lambda entry: (entry[3] is None, entry[3], entry[0].lower()))
+
+    #GitHub has no priorities, so the GitLab one leads the description - which can only be 100 characters
+    @staticmethod
+    def to_json(entry):
+        name, color, description, priority = entry
+        if priority is not None:
+            description = ("GitLab priority %d. %s" % (priority, description)) if description else "GitLab priority %d" % priority
+        return json.dumps({"name": name, "color": color, "description": description[:100]})
+
+label_catalog = Label_Catalog() #filled in by parse_export
+
+#names of the labels on a raw issue or MR, in the order GitLab has them
+def label_names(item):
+    names = []
+    seen = set()
+    for link in item.get('label_links') or ():
+        name = (link.get('label') or {}).get('title')
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            names.append(name)
+    return tuple(names)
+
+
+#ATTACHMENTS ----------------------------------------------------------------------------
+
+#Rehosted files are stored under their sha256 (in a directory of their own, so they keep the name they were uploaded with), which means the same
+#bytes are only ever stored once however many times, and under whatever names, they were uploaded to GitLab. What has been stored is
+#remembered in ATTACHMENT_CACHE_FILE across runs.
+class Attachment_Store:
+    def __init__(self, target, base_url=None, cache_filename=ATTACHMENT_CACHE_FILE):
+        self.git = target.startswith("git:")
+        self.root = target[4:] if self.git else target
+        if base_url is None:
+            if self.git:
+                raise ValueError("ATTACHMENT_BASE_URL has to be set to where the git attachment store is served from")
+            base_url = "file://" + urllib.parse.quote(os.path.abspath(self.root))
+        self.base_url = base_url.rstrip("/")
+        self.cache_filename = cache_filename
+        self.hosted = {} #sha256 -> URL
+        self.stored = 0 #files written this run
+        self.lock = threading.Lock()
+
+        if os.path.exists(cache_filename):
+            with open(cache_filename, "r") as f:
+                self.hosted.update(json.load(f))
+
+        if self.git and not os.path.isdir(os.path.join(self.root, ".git")):
+            os.makedirs(self.root, exist_ok=True)
+            subprocess.run(["git", "-C", self.root, "init", "--quiet"], check=True)
+
+    def url(self, digest):
+        return self.hosted.get(digest)
+
+    #safe to call from several threads at once
+    def store(self, digest, name, data):
+        relative = "%s/%s/%s" % (digest[:2], digest, name)
+        path = os.path.join(self.root, digest[:2], digest, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".partial", "wb") as f:
+            f.write(data)
+        os.replace(path + ".partial", path)
+
+        url = "%s/%s" % (self.base_url, urllib.parse.quote(relative))
+        with self.lock:
+            self.hosted[digest] = url
+            self.stored += 1
+        return url
+
+    #a git store gets everything stored this run as one commit, and only then are the new files remembered
+    def finish(self):
+        if self.git and self.stored:
+            subprocess.run(["git", "-C", self.root, "add", "--all"], check=True)
+            subprocess.run(["git", "-C", self.root, "commit", "--quiet", "-m", "Add %d attachments" % self.stored], check=True)
+            print("Committed %d attachments to %s - they can only be seen once it is pushed to %s" % (self.stored, self.root, self.base_url))
+
+        with open(self.cache_filename + ".partial", "w") as f:
+            json.dump(self.hosted, f, indent=1, sort_keys=True)
+        os.replace(self.cache_filename + ".partial", self.cache_filename)
+
+#GitLab shows a file attached to a note under it, on GitHub it can only be a link in the body - note id -> that link, for the notes with one
+def note_attachment_links(notes_raw):
+    links = {}
+    for note_json in notes_raw:
+        url = (note_json.get('attachment') or {}).get('url')
+        if url:
+            links[note_json.get('id')] = "\n\n[%s](%s)" % (url.rsplit("/", 1)[-1], url)
+    return links
+
+#A rewriter for links to attachments in bodies - either as GitLab writes them, or already pointed back at the GitLab project by the "uploads"
+#rewrite rule. replacement gets the path relative to the uploads directory and returns the new link.
+def attachment_link_rewriter(replacement):
+    return Body_Rewriter((Rewrite_Rule("attachments", r'(?<=\]\()(?:%s)?/uploads/[^)\s]+' % re.escape(project_base_url),
+                                       lambda text: replacement(text.split("/uploads/", 1)[1]) or text, outside_code=True),))
+
+#yields (path as linked, file object) for each of the wanted paths found in the export's uploads - a file object is only good until the next one
+def export_upload_files(wanted):
+    names = dict((urllib.parse.unquote(path), path) for path in wanted)
+
+    if UPLOADS_DIR is None and PROJECT_FILE.lower().endswith(archive_suffixes):
+        for name, f in archive_uploads(PROJECT_FILE):
+            if name in names:
+                yield names[name], f
+        return
+
+    uploads_dir = UPLOADS_DIR or os.path.join(os.path.dirname(PROJECT_FILE), "uploads")
+    for name, path in sorted(names.items()):
+        parts = name.split("/")
+        if ".." in parts:
+            continue
+        filename = os.path.join(uploads_dir, *parts)
+        if os.path.isfile(filename):
+            with open(filename, "rb") as f:
+                yield path, f
+
+
+#RECORD FILTERS -------------------------------------------------------------------------
+
+#Decides from the raw export record whether an issue or MR is imported at all, so the ones that aren't are dropped while the export is
+#being streamed, before any Issue, Merge_Request or Note is built for them. Every test that is set has to pass:
+#   states - GitLab states (opened, closed, merged, locked), "open" standing for opened and reopened
+#   created_after/created_before, updated_after/updated_before - dates or timestamps as GitLab writes them ("2016-01-31", "2016-01-31T12:00"),
+#       compared as text, after is inclusive and before isn't
+#   authors - full names, usernames or user ids, any case
+#   labels - label names, any one of them will do
+#   iids - like --iids (see import_selection)
+class Record_Filter:
+    def __init__(self, states=None, created_after=None, created_before=None, updated_after=None, updated_before=None, authors=None, labels=None, iids=None):
+        self.states = frozenset(self.state(state) for state in states) if states else None
+        self.created_after = created_after
+        self.created_before = created_before
+        self.updated_after = updated_after
+        self.updated_before = updated_before
+        self.authors = frozenset(str(author).lower() for author in authors) if authors else None
+        self.labels = frozenset(label.lower() for label in labels) if labels else None
+        self.selected = import_selection(iids) if iids else None
+        self.skipped = {"issues": 0, "merge_requests": 0}
+
+    @staticmethod
+    def state(state):
+        return "open" if state in ("opened", "reopened", "open") else state
+
+    #author names have to be known before any record is tested against them
+    @property
+    def needs_authors(self):
+        return self.authors is not None
+
+    def test(self, key, item):
+        if self.states is not None and self.state(item.get('state')) not in self.states:
+            return False
+
+        created_at = item.get('created_at') or ""
+        if self.created_after is not None and created_at < self.created_after:
+            return False
+        if self.created_before is not None and created_at >= self.created_before:
+            return False
+
+        updated_at = item.get('updated_at') or ""
+        if self.updated_after is not None and updated_at < self.updated_after:
+            return False
+        if self.updated_before is not None and updated_at >= self.updated_before:
+            return False
+
+        if self.authors is not None:
+            author_id = item.get('author_id')
+            names = (str(author_id), str(author_id_map.get(author_id)), str(secondary_author_id_map.get(author_id)))
+            if not any(name.lower() in self.authors for name in names):
+                return False
+
+        if self.labels is not None and not any(name.lower() in self.labels for name in label_names(item)):
+            return False
+
+        if self.selected is not None and not self.selected("issue" if key == "issues" else "mr", item['iid']):
+            return False
+
+        return True
+
+    #test, and count what doesn't pass
+    def matches(self, key, item):
+        if self.test(key, item):
+            return True
+        self.skipped[key] += 1
+        return False
+
+    def report(self):
+        if self.skipped["issues"] or self.skipped["merge_requests"]:
+            print("Filtered out %d Issues and %d MRs\n" % (self.skipped["issues"], self.skipped["merge_requests"]))
+
+#Remembers what every record let through looks like - its last activity (its own updated_at or its newest note's), a hash of what gets
+#synced, its state and its note ids - so that can be recorded in the journal once it is on GitHub. In delta mode it also only lets through
+#what is new or changed since it was last synced: a record is dropped if nothing happened to it after its high-water mark (the latest
+#activity it had then - a record that failed to sync keeps an older one), or if its hash is the same. Anything else is left to the filter it wraps.
+class Delta_Sync:
+    def __init__(self, synced, delta=False, record_filter=None):
+        self.synced = synced #(kind, key) -> (activity, content hash, state, note ids), see Import_Journal.read_sync
+        self.delta = delta
+        self.record_filter = record_filter
+        self.watermark = max((entry[0] for entry in synced.values()), default="")
+        self.current = {} #(kind, key) -> (activity, content hash, state, note ids) of the records let through
+        self.changed = set() #keys of records synced before that have changed since
+        self.unchanged = {"issues": 0, "merge_requests": 0}
+
+    @property
+    def needs_authors(self):
+        return self.record_filter is not None and self.record_filter.needs_authors
+
+    def matches(self, key, item):
+        if self.record_filter is not None and not self.record_filter.matches(key, item):
+            return False
+
+        record_key = ("issue" if key == "issues" else "mr", str(item['iid']))
+        notes = item.get('notes') or ()
+        activity = max([item.get('updated_at') or ""] + [note.get('updated_at') or "" for note in notes])
+        previous = self.synced.get(record_key)
+        if self.delta and previous is not None and activity <= previous[0]:
+            self.unchanged[key] += 1
+            return False
+
+        state = Record_Filter.state(str(item.get('state')))
+        note_ids = [note.get('id') for note in notes]
+        content_hash = hashlib.sha1(json.dumps([state, item.get('title'), item.get('description'),
+                                                [(note.get('id'), note.get('updated_at')) for note in notes]]).encode("utf-8")).hexdigest()
+        if self.delta and previous is not None and previous[1] == content_hash:
+            self.unchanged[key] += 1
+            return False
+
+        self.current[record_key] = (activity, content_hash, state, note_ids)
+        if self.delta and previous is not None:
+            self.changed.add(record_key)
+        return True
+
+    def report(self):
+        if self.record_filter is not None:
+            self.record_filter.report()
+        if self.delta:
+            print("Delta since %s: %d Issues and %d MRs unchanged, %d changed\n" % (self.watermark or "the beginning", self.unchanged["issues"],
+                  self.unchanged["merge_requests"], len(self.changed)))
+
+
+#PAYLOAD PLANNING -----------------------------------------------------------------------
+
+#GitHub rejects bodies over GH_BODY_LIMIT characters, and a huge import can fail as a whole. Payloads are measured before they are sent
+#and anything too big is split up here, always at the same places for the same input, so a request we know would fail is never made.
+split_notice = "\n\n*(continued in the next comment)*"
+
+#cuts text into parts of at most `limit` characters, at a line break where there is one in the second half of the part. A ``` block that
+#is cut is closed at the end of one part and opened again at the start of the next.
+def split_body(text, limit=GH_BODY_LIMIT):
+    parts = []
+    while len(text) > limit:
+        budget = limit - len(split_notice) - len("\n```")
+        cut = text.rfind("\n", budget // 2, budget)
+        if cut == -1:
+            cut = budget
+
+        part = text[:cut]
+        text = text[cut:].lstrip("\n")
+        if part.count("```") % 2 == 1:
+            part += "\n```"
+            text = "```\n" + text
+        parts.append(part + split_notice)
+
+    parts.append(text)
+    return parts
+
+#for an issue import: returns (payload to send, bodies of comments to post once it is imported). An oversized body continues in the first
+#comments, oversized comments are split into consecutive comments, and whatever doesn't fit in GH_IMPORT_PAYLOAD_LIMIT bytes follows
+#as comments of its own. The JSON can't be shorter than any body in it, so a small enough payload is passed through untouched.
+def plan_import_payload(data):
+    if len(data) <= GH_BODY_LIMIT:
+        return data, []
+
+    payload = json.loads(data)
+    issue = payload['issue']
+    parts = split_body(issue['body'])
+    issue['body'] = parts[0]
+
+    comments = []
+    for part in parts[1:]:
+        comments.append({"created_at": issue['created_at'], "body": part})
+    for comment in payload['comments']:
+        for part in split_body(comment['body']):
+            comments.append({"created_at": comment['created_at'], "body": part})
+
+    size = len(json.dumps(dict(payload, comments=[])).encode("utf-8"))
+    fitted = 0
+    for comment in comments:
+        size += len(json.dumps(comment).encode("utf-8")) + 2
+        if size > GH_IMPORT_PAYLOAD_LIMIT:
+            break
+        fitted += 1
+
+    payload['comments'] = comments[:fitted]
+    follow_ups = []
+    for comment in comments[fitted:]:
+        follow_ups.extend(split_body("(%s): %s\n" % (comment['created_at'], comment['body'])))
+    return json.dumps(payload), follow_ups
+
+#for a payload with a single body (a pull request or a comment): returns (payload with the first part of the body, the rest of it)
+def plan_body_payload(data):
+    if len(data) <= GH_BODY_LIMIT:
+        return data, []
+
+    payload = json.loads(data)
+    parts = split_body(payload['body'])
+    payload['body'] = parts[0]
+    return json.dumps(payload), parts[1:]
+
 #CLASSES -------------------------------------------------------------------------------
 
+#GitLab timestamps look like 2018-10-01T20:56:36.676Z - records keep them packed as integer milliseconds since the epoch, which is a lot
+#smaller than the string. Anything not in exactly that form (None, "None", other formats) is kept as it is so it serializes back unchanged.
+timestamp_format = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)\.(\d{3})Z\Z')
+epoch = datetime(1970, 1, 1)
+
+def pack_timestamp(value):
+    if type(value) is not str:
+        return value
+
+    match = timestamp_format.match(value)
+    if match is None:
+        return value
+
+    year, month, day, hour, minute, second, millis = [int(part) for part in match.groups()]
+    packed = calendar.timegm((year, month, day, hour, minute, second)) * 1000 + millis
+    if unpack_timestamp(packed) != value: #not a real date (e.g. Feb 30) - keep it as given
+        return value
+    return packed
+
+def unpack_timestamp(value):
+    if type(value) is not int:
+        return value
+
+    seconds, millis = divmod(value, 1000)
+    return (epoch + timedelta(seconds=seconds)).strftime("%Y-%m-%dT%H:%M:%S") + ".%03dZ" % millis
+
 #Class for comments on issues - called Notes in GitLab land
+#Records use __slots__ and only keep the note text itself; the author header is added when the note is serialized.
 class Note:
-    def __init__(self, author_name=None, timestamp=None, body=None):
+    __slots__ = ('note_id', 'author_name', 'packed_timestamp', 'text')
+
+    def __init__(self, author_name=None, timestamp=None, body=None, note_id=None):
+        self.note_id = note_id
         self.author_name = author_name
-        self.timestamp = timestamp
+        self.packed_timestamp = pack_timestamp(timestamp)
 
-        formatted_body = body
-        formatted_body = formatted_body.replace("```text","```")
+        self.text = body_rewriter.rewrite(body)
 
-        self.body = "**%s**:\n\n"%self.author_name + formatted_body
+    @property
+    def timestamp(self):
+        return unpack_timestamp(self.packed_timestamp)
+
+    @property
+    def body(self):
+        return "**%s**:\n\n"%self.author_name + reference_index.rewrite(self.text)
+
+    #how the note reads when it is posted as a comment of its own
+    @property
+    def comment_body(self):
+        return "(%s): %s\n"%(self.timestamp, self.body)
 
     def __str__(self):
         str_val = ""
@@ -42,64 +801,100 @@ class Note:
     def to_json(self):
         data = {}
 
-        data['body'] = "(%s): %s\n"%(self.timestamp, self.body)
+        data['body'] = self.comment_body
         
         return json.dumps(data)
 
+#The body of a request to github's issue import api, for an Issue or a closed Merge_Request: the issue itself, with its labels and
+#every note embedded as a comment. Timestamps the export didn't have are left out.
+def import_payload(record, body, closed):
+    data = {}
+
+    data['issue'] = {'title': record.title,
+                    'body': body,
+                    'created_at': record.created_at,
+                    'closed_at': record.closed_at,
+                    'updated_at': record.updated_at,
+                    'closed': closed}
+
+    if data['issue']['closed_at'] == "None":
+        del data['issue']['closed_at']
+    if data['issue']['updated_at'] == "None":
+        del data['issue']['updated_at']
+    if record.labels:
+        data['issue']['labels'] = list(record.labels)
+
+    comments = []
+
+    for note in record.notes:
+        comment = {}
+        comment["created_at"] = note.timestamp
+        comment["body"] = "%s"%(note.body)
+
+        comments.append(comment)
+
+    data['comments'] = comments
+
+    return json.dumps(data)
+
 #Class to organize an issue and allow for easy json exporting to GitHub's REST API
+#Like Note, the "(Imported #n)" title suffix, the original author/URL header and the timestamp strings are only built when asked for.
 class Issue:
-    def __init__(self, title=None, orig_author=None, orig_body=None, orig_issue_id=None, created_at=None, updated_at=None, closed_at=None, closed="open"):
-        self.title = title + " (Imported #%s)"%orig_issue_id
+    __slots__ = ('orig_title', 'orig_author', 'orig_issue_id', 'new_issue_id', 'packed_created_at', 'packed_updated_at', 'packed_closed_at', 'closed', 'labels', 'text', 'notes')
+
+    def __init__(self, title=None, orig_author=None, orig_body=None, orig_issue_id=None, created_at=None, updated_at=None, closed_at=None, closed="open", labels=()):
+        self.orig_title = title
         self.orig_author = orig_author
         self.orig_issue_id = orig_issue_id
         self.new_issue_id = None
-        self.created_at = created_at
-        self.updated_at = updated_at
-        self.closed_at = closed_at
+        self.packed_created_at = pack_timestamp(created_at)
+        self.packed_updated_at = pack_timestamp(updated_at)
+        self.packed_closed_at = pack_timestamp(closed_at)
         self.closed = closed
-        self.orig_issue_url = issues_base_url + str(orig_issue_id)
+        self.labels = labels #names only, the labels themselves are created up front
 
-        formatted_body = str(orig_body)
-        # formatted_body = body.replace("#","`#`")
-        formatted_body = formatted_body.replace("```text","```")
-
-        formatted_body = "Original Issue Author: %s\nOriginal Issue ID: %s\nOriginal Issue URL: %s\n______\n"%(orig_author,orig_issue_id,self.orig_issue_url) + formatted_body
-
-        self.body = str(formatted_body)
+        self.text = body_rewriter.rewrite(str(orig_body))
 
         self.notes = []
 
-    def add_note(self, note):
-        self.notes.append(note)
+    @property
+    def title(self):
+        return self.orig_title + " (Imported #%s)"%self.orig_issue_id
 
-    # Issues utilize github's latest import api and so they don't follow what is actually listed on github's api - eyeroll.
-    def to_json(self):
-        data = {}
+    @property
+    def orig_issue_url(self):
+        return issues_base_url + str(self.orig_issue_id)
 
-        data['issue'] = {'title': self.title,
-                        'body': self.body,
-                        'created_at': self.created_at,
-                        'closed_at': self.closed_at,
-                        'updated_at': self.updated_at,
-                        'closed': self.closed}
+    #what the journal, import tracker and reference index know this issue by
+    @property
+    def key(self):
+        return ("issue", self.orig_issue_id)
 
-        if data['issue']['closed_at'] == "None":
-            del data['issue']['closed_at']
-        if data['issue']['updated_at'] == "None":
-            del data['issue']['updated_at']
+    #timestamps come back as strings, "None" when the export didn't have one
+    @property
+    def created_at(self):
+        return str(unpack_timestamp(self.packed_created_at))
 
-        comments = []
+    @property
+    def updated_at(self):
+        return str(unpack_timestamp(self.packed_updated_at))
 
-        for note in self.notes:
-            comment = {}
-            comment["created_at"] = note.timestamp
-            comment["body"] = "%s"%(note.body)
+    @property
+    def closed_at(self):
+        return str(unpack_timestamp(self.packed_closed_at))
+
+    @property
+    def body(self):
+        return "Original Issue Author: %s\nOriginal Issue ID: %s\nOriginal Issue URL: %s\n______\n"%(self.orig_author,self.orig_issue_id,self.orig_issue_url) + reference_index.rewrite(self.text)
 
-            comments.append(comment)
+    def add_note(self, note):
+        self.notes.append(note)
 
-        data['comments'] = comments
+    # Issues utilize github's latest import api and so they don't follow what is actually listed on github's api - eyeroll.
+    def to_json(self):
+        return import_payload(self, self.body, self.closed)
 
-        return json.dumps(data)
+    to_import_json = to_json #what create_github_issue sends - closed merge requests have their own
 
     def __str__(self):
         str_val = ""
@@ -110,6 +905,8 @@ class Issue:
         str_val += "Updated At: %s\n"%(self.updated_at)
         str_val += "Closed At: %s\n"%(self.closed_at)
         str_val += "Closed: %s\n"%(self.closed)
+        if self.labels:
+            str_val += "Labels: %s\n"%(", ".join(self.labels))
         str_val += "Original Issue URL: %s\n"%(self.orig_issue_url)
         str_val += "\nIssue Body:\n%s\n"%(self.body)
         str_val += "\n\nNotes:\n"
@@ -121,26 +918,52 @@ class Issue:
 
 
 class Merge_Request:
-    def __init__(self, title=None, orig_author=None, orig_body=None, orig_mr_id=None, created_at=None, updated_at=None, state="open", head_branch=None, target_branch=None):
-        self.title = title + " (Imported !%s)"%orig_mr_id
+    __slots__ = ('orig_title', 'head_branch', 'target_branch', 'orig_author', 'orig_mr_id', 'new_issue_id', 'packed_created_at', 'packed_updated_at', 'packed_closed_at', 'state', 'labels', 'text', 'notes')
+
+    def __init__(self, title=None, orig_author=None, orig_body=None, orig_mr_id=None, created_at=None, updated_at=None, state="open", head_branch=None, target_branch=None, closed_at=None, labels=()):
+        self.orig_title = title
         self.head_branch = head_branch
         self.target_branch = target_branch
         self.orig_author = orig_author
         self.orig_mr_id = orig_mr_id
         self.new_issue_id = None
-        self.created_at = created_at
-        self.updated_at = updated_at
+        self.packed_created_at = pack_timestamp(created_at)
+        self.packed_updated_at = pack_timestamp(updated_at)
+        self.packed_closed_at = pack_timestamp(closed_at)
         self.state = state
-        self.orig_mr_url = mr_base_url + str(orig_mr_id)
+        self.labels = labels #the pulls api doesn't take labels, an open MR's are set after it is created
 
-        formatted_body = str(orig_body)
-        formatted_body = formatted_body.replace("```text", "```")
+        self.text = body_rewriter.rewrite(str(orig_body))
 
-        formatted_body = "Original MR Author: %s\nOriginal MR ID: %s\nOriginal MR URL: %s\n______\n"%(orig_author,orig_mr_id,self.orig_mr_url) + formatted_body
+        self.notes = []
 
-        self.body = str(formatted_body)
+    @property
+    def title(self):
+        return self.orig_title + " (Imported !%s)"%self.orig_mr_id
 
-        self.notes = []
+    @property
+    def orig_mr_url(self):
+        return mr_base_url + str(self.orig_mr_id)
+
+    @property
+    def key(self):
+        return ("mr", self.orig_mr_id)
+
+    @property
+    def created_at(self):
+        return str(unpack_timestamp(self.packed_created_at))
+
+    @property
+    def updated_at(self):
+        return str(unpack_timestamp(self.packed_updated_at))
+
+    @property
+    def closed_at(self):
+        return str(unpack_timestamp(self.packed_closed_at))
+
+    @property
+    def body(self):
+        return "Original MR Author: %s\nOriginal MR ID: %s\nOriginal MR URL: %s\n______\n"%(self.orig_author,self.orig_mr_id,self.orig_mr_url) + reference_index.rewrite(self.text)
 
     def add_note(self, note):
         self.notes.append(note)
@@ -156,6 +979,11 @@ class Merge_Request:
 
         return json.dumps(data)
 
+    # Closed and merged MRs can't be opened as pull requests again (their branches are usually gone), so they go through the issue import api
+    # instead, the same way Issue.to_json does it: one request with every note embedded as a comment, rather than a POST per note.
+    def to_import_json(self):
+        return import_payload(self, self.body + "\n\n______\n%s MR: `%s` into `%s`\n"%(self.state.capitalize(), self.head_branch, self.target_branch), True)
+
     def __str__(self):
         str_val = ""
         str_val += "Title: %s\n"%(self.title)
@@ -164,6 +992,8 @@ class Merge_Request:
         str_val += "Created At: %s\n"%(self.created_at)
         str_val += "Updated At: %s\n"%(self.updated_at)
         str_val += "State: %s\n"%(self.state)
+        if self.labels:
+            str_val += "Labels: %s\n"%(", ".join(self.labels))
         str_val += "\nMR Body:\n%s\n"%(self.body)
         str_val += "\n\nNotes:\n"
 
@@ -172,46 +1002,1314 @@ class Merge_Request:
 
         return str_val
 
+#On-disk record of everything sent to GitHub, keyed by ("issue", iid), ("mr", iid) or ("note", note id), holding the status, the GitHub number
+#assigned and a hash of the payload. All entries are loaded into a dict when the journal is opened so a restart can skip finished work in O(1),
+#and entries that only say how something ended are buffered and written in batches so the journal doesn't slow down the send loop.
+class Import_Journal:
+    done_states = ("imported", "created")
+    #"sent" is an import github accepted but hadn't finished, "unknown" a POST that got no answer or a 5xx, which may have created
+    #something anyway - neither is ever sent again automatically, since that could make a duplicate
+    unresolved_states = ("sent", "unknown")
+    #losing one of these to a crash (or a kill) would get it sent again as a duplicate, so they are on disk before record() returns -
+    #only the final statuses of imports, failures and the sync table are left to be written in batches
+    durable_states = ("sent", "created", "unknown")
+    imported_title = re.compile(r'\(Imported ([#!])(\d+)\)$') #the iid at the end of every title we send, see Issue.title and Merge_Request.title
+    #what each issue and MR looked like in the export it was last synced from, for --delta (see Delta_Sync)
+    sync_table = "CREATE TABLE IF NOT EXISTS sync (kind TEXT, key TEXT, activity TEXT, content_hash TEXT, state TEXT, note_ids TEXT, PRIMARY KEY (kind, key))"
+
+    def __init__(self, flush_size=JOURNAL_FLUSH_SIZE, flush_seconds=JOURNAL_FLUSH_SECONDS):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.db = None
+        self.entries = {} #(kind, key) -> (status, github number, import id, payload hash)
+        self.missing = {} #(kind, key) of an issue or MR -> keys of its follow-up comments that aren't on github yet
+        self.unflushed = []
+        self.unflushed_sync = []
+        self.last_flush = monotonic()
+        self.lock = threading.Lock()
+
+    def open(self, filename):
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS journal (kind TEXT, key TEXT, status TEXT, github_number INTEGER, import_id INTEGER, payload_hash TEXT, updated_at REAL, PRIMARY KEY (kind, key))")
+        self.db.execute(self.sync_table)
+
+        for kind, key, status, github_number, import_id, payload_hash in self.db.execute("SELECT kind, key, status, github_number, import_id, payload_hash FROM journal"):
+            self.entries[(kind, key)] = (status, github_number, import_id, payload_hash)
+            if kind == "follow_up":
+                self.track_follow_up(key, status)
+
+        print("Loaded %d journal entries from %s\n" % (len(self.entries), filename))
+        sent = [item for item, entry in self.entries.items() if entry[0] == "sent" and entry[2] is not None]
+        if sent:
+            self.resolve_sent(sent)
+        unknown = [item for item, entry in self.entries.items() if entry[0] == "unknown" and item[0] in ("issue", "mr")]
+        if unknown:
+            since = self.db.execute("SELECT MIN(updated_at) FROM journal WHERE status = 'unknown'").fetchone()[0]
+            self.resolve_unknown(unknown, since)
+
+        unknown = [item for item, entry in self.entries.items() if entry[0] == "unknown"]
+        if unknown:
+            print("%d items may or may not have made it to GitHub, so they aren't sent again - check them there, and rerun with --resend-unknown "
+                  "to send the ones that are missing: %s\n" % (len(unknown), ", ".join("%s %s" % item for item in unknown)))
+
+    #"sent" means github accepted the import but hadn't finished it when the journal was last written - ask it what became of each,
+    #so one that went through gets its number and one that failed is recorded as failed (and can be found with --failed-from)
+    def resolve_sent(self, items, attempts=IMPORT_RESOLVE_ATTEMPTS):
+        print("Checking %d imports that hadn't finished when the last run stopped..." % len(items))
+        for attempt in range(attempts):
+            if attempt:
+                sleep(IMPORT_STATUS_INTERVAL)
+            pending = []
+            for kind, key in items:
+                import_id = self.entries[(kind, key)][2]
+                response = github_transport.request("GET", "import_issues", "/import/issues/%d" % import_id)
+                status_json = json.loads(response.content) if response.status_code == 200 else {}
+                if status_json.get('status') == "imported":
+                    self.record(kind, key, "imported", github_number=import_issue_number(status_json))
+                elif status_json.get('status') == "failed":
+                    print('Import %d of %s %s failed: %s' % (import_id, kind, key, status_json.get('errors')))
+                    self.record(kind, key, "failed")
+                else:
+                    pending.append((kind, key))
+            items = pending
+            if not items:
+                return
+
+        print("%d imports still couldn't be checked, they are skipped until a later run can: %s\n" % (len(items), ", ".join("%s %s" % item for item in items)))
+
+    #An issue import whose POST got no answer may have been created all the same. If it was, it is in github's import listing under an
+    #import id we never heard of, and the issue it became has the iid at the end of its title.
+    def resolve_unknown(self, items, since):
+        since = datetime.fromtimestamp(since - 60, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") #a minute early, the clocks can disagree
+        response = github_transport.request("GET", "import_issues", "/import/issues?since=%s" % since)
+        if response.status_code != 200:
+            print("Could not check the imports that didn't get an answer")
+            print('Response:', response.content)
+            return
+
+        print("Checking whether %d imports that didn't get an answer went through..." % len(items))
+        wanted = set(items)
+        known = set(entry[2] for entry in self.entries.values() if entry[2] is not None)
+        for status_json in json.loads(response.content):
+            if status_json['id'] in known or status_json.get('status') != "imported":
+                continue
+            issue = github_transport.request("GET", "issues", status_json['issue_url'])
+            if issue.status_code != 200:
+                continue
+            match = self.imported_title.search(json.loads(issue.content).get('title') or "")
+            item = match is not None and ("issue" if match.group(1) == "#" else "mr", match.group(2))
+            if item in wanted:
+                self.record(*item, "imported", github_number=import_issue_number(status_json), import_id=status_json['id'])
+                wanted.discard(item)
+
+    #A follow-up comment (see post_follow_up_comments) is keyed "<kind>:<iid>:<n>" for the nth part of an issue or MR's own payload and
+    #"<kind>:<iid>:note:<note id>:<n>" for one of a note's, so the record it belongs to is the start of the key.
+    def track_follow_up(self, key, status):
+        owner = tuple(key.split(":")[:2])
+        if status in self.done_states:
+            self.missing.get(owner, set()).discard(key)
+        else:
+            self.missing.setdefault(owner, set()).add(key)
+
+    #whether some of the comments an issue or MR was too big for haven't made it to github yet
+    def follow_ups_missing(self, kind, key):
+        return bool(self.missing.get((kind, str(key))))
+
+    #for --resend-unknown, once someone has checked which of them didn't make it to GitHub after all
+    def forget_unknown(self):
+        for (kind, key), entry in list(self.entries.items()):
+            if entry[0] == "unknown":
+                self.record(kind, key, "failed")
+
+    #something github may have, which can't be sent again without risking a duplicate
+    def unresolved(self, kind, key):
+        entry = self.entries.get((kind, str(key)))
+        return entry is not None and entry[0] in self.unresolved_states
+
+    def get(self, kind, key):
+        return self.entries.get((kind, str(key)))
+
+    def done(self, kind, key):
+        entry = self.entries.get((kind, str(key)))
+        return entry is not None and entry[0] in self.done_states
+
+    def github_number(self, kind, key):
+        entry = self.entries.get((kind, str(key)))
+        if entry is None:
+            return None
+        return entry[1]
+
+    #fields that aren't given keep whatever was recorded for this item before
+    def record(self, kind, key, status, github_number=None, import_id=None, payload=None):
+        key = str(key)
+        payload_hash = None
+        if payload is not None:
+            payload_hash = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+        with self.lock:
+            previous = self.entries.get((kind, key), (None, None, None, None))
+            entry = (status,
+                     github_number if github_number is not None else previous[1],
+                     import_id if import_id is not None else previous[2],
+                     payload_hash if payload_hash is not None else previous[3])
+            self.entries[(kind, key)] = entry
+            if kind == "follow_up":
+                self.track_follow_up(key, status)
+            self.unflushed.append((kind, key) + entry + (time(),))
+
+            if status in self.durable_states or len(self.unflushed) >= self.flush_size or monotonic() - self.last_flush >= self.flush_seconds:
+                self.flush_locked()
+
+    def record_sync(self, kind, key, activity, content_hash, state, note_ids):
+        with self.lock:
+            self.unflushed_sync.append((kind, str(key), activity, content_hash, state, json.dumps(note_ids)))
+            if len(self.unflushed_sync) >= self.flush_size:
+                self.flush_locked()
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        if self.db is not None and (self.unflushed or self.unflushed_sync):
+            self.db.executemany("INSERT OR REPLACE INTO journal VALUES (?, ?, ?, ?, ?, ?, ?)", self.unflushed)
+            self.db.executemany("INSERT OR REPLACE INTO sync VALUES (?, ?, ?, ?, ?, ?)", self.unflushed_sync)
+            self.db.commit()
+        self.unflushed = []
+        self.unflushed_sync = []
+        self.last_flush = monotonic()
+
+    #(kind, key) -> (activity, content hash, state, note ids) from a journal file, which is only read - needed before main() opens it
+    @classmethod
+    def read_sync(cls, filename):
+        if not os.path.exists(filename):
+            return {}
+        db = sqlite3.connect(filename)
+        try:
+            db.execute(cls.sync_table)
+            return dict(((kind, key), (activity, content_hash, state, json.loads(note_ids)))
+                        for kind, key, activity, content_hash, state, note_ids in db.execute("SELECT * FROM sync"))
+        finally:
+            db.close()
+
+    def close(self):
+        self.flush()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+import_journal = Import_Journal() #only kept in memory until main() opens the journal file
+
+#Reads the elements of top level arrays out of a GitLab export one record at a time, so a multi-GB project.json never has to be held in memory all at once.
+#Only the record currently being decoded (plus one read chunk) is kept around; values we aren't interested in are scanned past without being decoded.
+class Export_Stream:
+    whitespace = re.compile(r'[ \t\n\r]*')
+    structural = re.compile(r'[\[\]{}"]')
+    string_tail = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"')
+    decoder = json.JSONDecoder()
+
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.offset = 0 #characters of the file before buf
+        self.eof = False
+
+    #pull more text into the buffer, dropping whatever has already been consumed
+    def fill(self, min_size=0):
+        chunk = self.f.read(max(self.chunk_size, min_size))
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    #return the next non-whitespace character without consuming it ("" at end of file)
+    def peek(self):
+        while True:
+            self.pos = self.whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError("Malformed export: expected '%s' but found '%s'"%(char, found))
+        self.pos += 1
+
+    #decode one complete JSON value - the read size doubles while the value is incomplete so a huge record is not re-parsed once per chunk
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self.fill(len(self.buf) - self.pos):
+                    raise
+                continue
+
+            #a number can be cut in half by the end of the buffer and still decode, so make sure something follows it
+            if end == len(self.buf) and not self.eof:
+                self.fill(len(self.buf) - self.pos)
+                continue
+
+            self.pos = end
+            return value
+
+    #move past one JSON value. Arrays are decoded and thrown away one element at a time, which keeps memory bounded and is a lot
+    #faster than scanning them in python; anything else is scanned past without building any python objects for it
+    def skip_value(self):
+        char = self.peek()
+        if char == "[":
+            for item in self.array_items():
+                pass
+            return
+        if char != "{":
+            self.decode_value()
+            return
+
+        depth = 0
+        while True:
+            match = self.structural.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self.fill():
+                    raise ValueError("Malformed export: unexpected end of file")
+                continue
+
+            char = match.group()
+            if char == '"':
+                tail = self.string_tail.match(self.buf, match.end())
+                if tail is None:
+                    self.pos = match.start()
+                    if not self.fill(len(self.buf) - self.pos):
+                        raise ValueError("Malformed export: unterminated string")
+                    continue
+                self.pos = tail.end()
+            else:
+                self.pos = match.end()
+                if char in "[{":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return
+
+    #yields each key of the top level object - the caller must consume or skip the value before asking for the next key
+    def object_keys(self):
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+
+        while True:
+            key = self.decode_value()
+            self.expect(":")
+            yield key
+
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("}")
+                return
+
+    #yields each element of the array at the current position
+    def array_items(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+
+        while True:
+            yield self.decode_value()
+
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("]")
+                return
+
+    #like array_items, but yields (start, end, element) with where each element is in the file, in characters
+    def array_spans(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+
+        while True:
+            self.peek()
+            start = self.offset + self.pos
+            value = self.decode_value()
+            yield start, self.offset + self.pos, value
+
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("]")
+                return
+
+#Hands out the text of a compressed export while the next chunks are already being decompressed and decoded on another thread - zlib
+#and zstd let go of the GIL while they work, so decompressing overlaps with parsing. Closing it closes every layer it was read through.
+class Read_Ahead:
+    def __init__(self, f, layers=(), depth=STREAM_READ_AHEAD, chunk_size=STREAM_CHUNK_SIZE):
+        self.f = f #binary, utf-8
+        self.layers = list(layers) #closed last to first
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.chunks = queue.Queue(maxsize=depth)
+        self.finished = False
+        self.closed = False
+        self.thread = threading.Thread(target=self.produce, daemon=True)
+        self.thread.start()
+
+    def produce(self):
+        try:
+            while not self.closed:
+                data = self.f.read(self.chunk_size)
+                if not data:
+                    self.decoder.decode(b"", final=True) #raises on a truncated character
+                    self.put(None)
+                    return
+                self.put(self.decoder.decode(data))
+        except Exception as error:
+            self.put(error) #raised to the reader instead
+
+    #give up if the reader is gone, otherwise a full queue would keep this thread around forever
+    def put(self, item):
+        while not self.closed:
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    #at least size characters unless the export ends first, "" at the end
+    def read(self, size):
+        parts = []
+        length = 0
+        while length < size and not self.finished:
+            chunk = self.chunks.get()
+            if isinstance(chunk, Exception):
+                self.finished = True
+                raise chunk
+            if chunk is None:
+                self.finished = True
+                break
+            parts.append(chunk)
+            length += len(chunk)
+        return "".join(parts)
+
+    def close(self):
+        self.closed = True
+        self.thread.join()
+        for layer in reversed(self.layers):
+            layer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+archive_suffixes = (".tar", ".tgz", ".tar.gz", ".tar.zst", ".tar.zstd")
+
+#the layers a .gz, .zst or .zstd file (or a plain one) is read through, to be closed last to first - the last one gives the decompressed bytes
+def open_decompressed(filename):
+    name = filename.lower()
+    layers = [open(filename, "rb")]
+    try:
+        if name.endswith((".gz", ".tgz")):
+            layers.append(gzip.GzipFile(fileobj=layers[-1], mode="rb"))
+        elif name.endswith((".zst", ".zstd")):
+            if zstandard is None:
+                raise ImportError("%s is zstd compressed, reading it needs the zstandard module (pip install zstandard)" % filename)
+            layers.append(zstandard.ZstdDecompressor().stream_reader(layers[-1]))
+        return layers
+    except Exception:
+        for layer in reversed(layers):
+            layer.close()
+        raise
+
+#Opens an export for reading as text: plain .json as it is, .gz and .zst (or .zstd) decompressed as they are read, and .tar, .tgz,
+#.tar.gz and .tar.zst archives (GitLab's project export) by reading EXPORT_ARCHIVE_MEMBER straight out of the tar stream.
+#Nothing is extracted to disk.
+def open_export(filename, member=EXPORT_ARCHIVE_MEMBER):
+    if not filename.lower().endswith((".gz", ".zst", ".zstd") + archive_suffixes):
+        return open(filename, "r")
+
+    layers = open_decompressed(filename)
+    try:
+        if filename.lower().endswith(archive_suffixes):
+            archive = tarfile.open(fileobj=layers[-1], mode="r|") #stream mode, members can only be read in order
+            layers.append(archive)
+            for info in archive:
+                if info.isfile() and os.path.basename(info.name) == member:
+                    layers.append(archive.extractfile(info))
+                    break
+            else:
+                raise ValueError("Malformed export: %s has no %s in it" % (filename, member))
+
+        return Read_Ahead(layers[-1], layers)
+    except Exception:
+        for layer in reversed(layers):
+            layer.close()
+        raise
+
+#yields (path under uploads/, file object) for each file in the uploads directory of a project export archive, in one pass over it -
+#a file object is only good until the next one is asked for
+def archive_uploads(filename):
+    layers = open_decompressed(filename)
+    try:
+        archive = tarfile.open(fileobj=layers[-1], mode="r|")
+        layers.append(archive)
+        for info in archive:
+            name = info.name[2:] if info.name.startswith("./") else info.name
+            if info.isfile() and name.startswith("uploads/"):
+                yield name[len("uploads/"):], archive.extractfile(info)
+    finally:
+        for layer in reversed(layers):
+            layer.close()
+
+#Token bucket that sends as fast as we allow it to and only backs off when GitHub tells us to.
+#Retry-After and secondary limit responses pause sending and halve the rate, which then creeps back up with every successful request.
+#Running out of quota is up to the Token_Pool, since that only stops the one token.
+class Rate_Limiter:
+    min_rate = 0.01
+
+    def __init__(self, max_rate=RATE_LIMIT_MAX_PER_SECOND, burst=RATE_LIMIT_BURST, secondary_backoff=RATE_LIMIT_SECONDARY_BACKOFF):
+        self.max_rate = max_rate
+        self.rate = max_rate #lowered by secondary limits
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_refill = monotonic()
+        self.paused_until = 0.0
+        self.secondary_backoff = secondary_backoff
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    #block until we are allowed to send one request
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            sleep(wait)
+
+    def pause(self, seconds):
+        until = monotonic() + seconds
+        if until > self.paused_until:
+            self.paused_until = until
+            self.tokens = 0.0
+
+    #adjust the pacing from a response - returns True if GitHub rate limited this request and it should be sent again
+    def update(self, response):
+        headers = response.headers
+        remaining = headers.get("X-RateLimit-Remaining")
+        retry_after = headers.get("Retry-After")
+
+        with self.lock:
+            self.refill(monotonic())
+
+            #out of quota - the token pool takes that token out of rotation until its window resets
+            exhausted = remaining is not None and int(remaining) <= 0
+
+            limited = False
+            if response.status_code == 429 or (response.status_code == 403 and (retry_after is not None or exhausted or self.is_secondary_limit(response))):
+                limited = True
+                if retry_after is not None:
+                    self.pause(float(retry_after))
+                elif not exhausted:
+                    self.pause(self.secondary_backoff)
+
+                if not exhausted:
+                    self.rate = max(self.rate / 2, self.min_rate)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+        return limited
+
+    @staticmethod
+    def is_secondary_limit(response):
+        content = response.content.lower()
+        return b"secondary rate limit" in content or b"abuse" in content
+
+rate_limiter = Rate_Limiter(max_rate=RATE_LIMIT_MAX_PER_SECOND * len(GH_TOKENS)) #shared by every request to GitHub - secondary limits are per token
+
+network_error_status = 599 #status of the stand-in response for a request that never got one (connection reset, timeout...)
+
+#What to journal for a POST that didn't succeed: "unknown" if it may have created something all the same - it got no answer after it was
+#sent, or a 5xx, which can come after github already did - or "failed" if nothing was created (a 4xx, or a connection never made).
+def failed_post_status(response):
+    if response.status_code == network_error_status:
+        return "unknown" if getattr(response, "reached", True) else "failed"
+    return "unknown" if response.status_code >= 500 else "failed"
+
+#Decides which failures are worth another attempt and how long to wait before it: exponential backoff with full jitter, so senders that
+#failed together don't all come back at the same moment.
+class Retry_Policy:
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, retry_statuses=RETRY_STATUS_CODES):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses) | {network_error_status}
+
+    def retryable(self, response):
+        return response.status_code in self.retry_statuses
+
+    #A POST creates something every time it gets through, and a timeout waiting for the answer or a 5xx can come after GitHub already
+    #did - sending it again could make a duplicate issue or comment. So a POST is only sent again if it never reached GitHub at all.
+    def resendable(self, method, reached):
+        return method != "POST" or not reached
+
+    #whether a request that failed with this error could have reached GitHub - a refused or timed out connection means nothing was sent,
+    #a connection dropped while waiting for the answer (urllib3's ProtocolError) or a read timeout means it may have been
+    @staticmethod
+    def reached(error):
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return False
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return bool(error.args) and isinstance(error.args[0], ProtocolError)
+        return True
+
+    #how long to wait before retry number `attempt` (1 for the first)
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+#Watches the outcome of the latest requests. Closed it lets everything through; once too many of them failed it opens and holds every
+#sender for the cooldown, then lets a single trial request through (half open) - success closes it again, failure opens it for another cooldown.
+#Rate limiting and 4xx responses don't count as failures, GitHub is up and answering.
+class Circuit_Breaker:
+    def __init__(self, window=CIRCUIT_WINDOW, failure_ratio=CIRCUIT_FAILURE_RATIO, cooldown=CIRCUIT_COOLDOWN):
+        self.outcomes = deque(maxlen=window)
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.state = "closed" #closed, open or half open
+        self.open_until = 0.0
+        self.trial_sent = False
+        self.trips = 0
+        self.lock = threading.Condition()
+
+    #block until a request may be sent
+    def before(self):
+        with self.lock:
+            while True:
+                now = monotonic()
+                if self.state == "closed":
+                    return
+                if self.state == "open" and now >= self.open_until:
+                    self.state = "half open"
+                    self.trial_sent = False
+                if self.state == "half open" and not self.trial_sent:
+                    self.trial_sent = True
+                    return
+                self.lock.wait(self.open_until - now if self.state == "open" else 1.0)
+
+    def after(self, succeeded):
+        with self.lock:
+            if self.state == "half open":
+                if succeeded:
+                    print("GitHub is answering again, resuming")
+                    self.state = "closed"
+                    self.outcomes.clear()
+                else:
+                    self.trip()
+                self.lock.notify_all()
+                return
+
+            self.outcomes.append(succeeded)
+            if len(self.outcomes) == self.outcomes.maxlen and self.outcomes.count(False) >= self.failure_ratio * len(self.outcomes):
+                self.trip()
+
+    def trip(self):
+        self.state = "open"
+        self.open_until = monotonic() + self.cooldown
+        self.trips += 1
+        print("Too many requests to GitHub are failing, pausing for %d seconds" % self.cooldown)
+
+#Per endpoint counts and latencies of every attempt made, printed at the end of a run
+class Transport_Stats:
+    def __init__(self):
+        self.endpoints = {} #endpoint -> {"requests", "attempts", "retries", "failed", "latencies"}
+        self.lock = threading.Lock()
+
+    def endpoint(self, endpoint):
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints[endpoint] = {"requests": 0, "attempts": 0, "retries": 0, "failed": 0, "latencies": []}
+        return stats
+
+    def attempt(self, endpoint, latency, retry):
+        with self.lock:
+            stats = self.endpoint(endpoint)
+            stats["attempts"] += 1
+            stats["latencies"].append(latency)
+            if retry:
+                stats["retries"] += 1
+
+    def finish(self, endpoint, response):
+        with self.lock:
+            stats = self.endpoint(endpoint)
+            stats["requests"] += 1
+            if response.status_code >= 400:
+                stats["failed"] += 1
+
+    def report(self, breaker=None):
+        if not self.endpoints:
+            return
+        print("\n%-16s %9s %9s %9s %9s %10s %10s %10s" % ("endpoint", "requests", "attempts", "retries", "failed", "p50 ms", "p99 ms", "max ms"))
+        for endpoint, stats in sorted(self.endpoints.items()):
+            latencies = sorted(stats["latencies"]) or [0.0]
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print("%-16s %9d %9d %9d %9d %10.1f %10.1f %10.1f" % (endpoint, stats["requests"], stats["attempts"], stats["retries"], stats["failed"],
+                  p50 * 1000, p99 * 1000, latencies[-1] * 1000))
+        if breaker is not None and breaker.trips:
+            print("Sending was paused %d times by the circuit breaker" % breaker.trips)
+
+#One access token and what GitHub last told us about its quota
+class Pool_Token:
+    __slots__ = ('token', 'name', 'limit', 'remaining', 'reset_at', 'requests', 'headers')
+
+    def __init__(self, token):
+        self.token = token
+        self.name = "..." + token[-4:]
+        self.limit = None
+        self.remaining = None #unknown until the first response
+        self.reset_at = 0.0
+        self.requests = 0
+        self.headers = {} #endpoint -> headers for requests sent with this token
+
+#Every request takes the token with the most quota left, counting requests still in flight, so the load spreads out by itself. A token
+#that has run out sits out until its X-RateLimit-Reset, and sending only waits when all of them have.
+class Token_Pool:
+    def __init__(self, tokens):
+        self.tokens = [Pool_Token(token) for token in tokens]
+        self.lock = threading.Lock()
+
+    def headroom(self, token, now):
+        if token.remaining is None or now >= token.reset_at:
+            return token.limit or 5000
+        return token.remaining
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time()
+                best = max(self.tokens, key=lambda token: self.headroom(token, now))
+                if self.headroom(best, now) > 0:
+                    if now >= best.reset_at:
+                        best.remaining = None
+                    elif best.remaining is not None:
+                        best.remaining -= 1
+                    best.requests += 1
+                    return best
+                wait = min(token.reset_at for token in self.tokens) - now
+            sleep(max(wait, 1.0))
+
+    def update(self, token, response):
+        headers = response.headers
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is None:
+            return
+
+        with self.lock:
+            token.remaining = int(remaining)
+            token.limit = int(headers.get("X-RateLimit-Limit", token.limit or 5000))
+            token.reset_at = float(headers.get("X-RateLimit-Reset", time() + 3600)) + 1 #whole seconds, so give it until the next one
+            if token.remaining <= 0:
+                print("Token %s is out of quota for %d seconds%s" % (token.name, max(token.reset_at - time(), 0),
+                      ", switching tokens" if any(self.headroom(other, time()) > 0 for other in self.tokens) else ""))
+
+    def report(self):
+        if len(self.tokens) < 2:
+            return
+        for token in self.tokens:
+            print("Token %s: %d requests, %s of %s quota left" % (token.name, token.requests, token.remaining, token.limit))
+
+#All GitHub API calls go through one of these - a pooled keep-alive session so we aren't doing a new TCP+TLS handshake per request,
+#with the headers for each endpoint built once up front rather than on every call.
+class GitHub_Transport:
+    #tokens is one access token or a list of them
+    def __init__(self, tokens, owner=GH_OWNER, repo=GH_REPO, api_url=GH_API_URL, pool_size=HTTP_POOL_SIZE, limiter=rate_limiter, retry_policy=None, breaker=None):
+        if type(tokens) is str:
+            tokens = [tokens]
+        self.tokens = Token_Pool(tokens)
+        self.limiter = limiter
+        self.retry_policy = retry_policy or Retry_Policy()
+        self.breaker = breaker or Circuit_Breaker()
+        self.stats = Transport_Stats()
+        self.api_url = api_url.rstrip("/")
+        self.repo_url = "%s/repos/%s/%s"%(self.api_url, owner, repo)
+        self.shared = False #a view of another transport doesn't own its connections
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        for token in self.tokens.tokens:
+            for endpoint, accept in GH_ENDPOINT_ACCEPT.items():
+                token.headers[endpoint] = {
+                    "Authorization": "token %s" % token.token,
+                    "Accept": accept
+                }
+
+    #path is relative to the repo, e.g. "/import/issues", or a full URL GitHub gave us back
+    def request(self, method, endpoint, path, data=None, headers=None):
+        if path.startswith("http"):
+            url = path
+        else:
+            url = self.repo_url + path
+
+        limited = 0
+        failures = 0
+        while True:
+            self.breaker.before()
+            self.limiter.acquire()
+            token = self.tokens.acquire()
+
+            request_headers = token.headers[endpoint]
+            if headers:
+                request_headers = dict(request_headers, **headers)
+
+            start = monotonic()
+            reached = True
+            try:
+                response = self.session.request(method, url, data=data, headers=request_headers, timeout=HTTP_TIMEOUT)
+            except requests.exceptions.RequestException as error:
+                reached = self.retry_policy.reached(error)
+                response = self.failed_response(url, error, reached)
+            self.stats.attempt(endpoint, monotonic() - start, limited + failures > 0)
+            self.tokens.update(token, response)
+
+            retryable = self.retry_policy.retryable(response)
+            self.breaker.after(not retryable)
+
+            if self.limiter.update(response):
+                if limited >= RATE_LIMIT_MAX_RETRIES:
+                    break
+                limited += 1
+                print("Rate limited by GitHub on %s, backing off"%path)
+                continue
+
+            if not retryable or failures >= self.retry_policy.max_attempts:
+                break
+            if not self.retry_policy.resendable(method, reached):
+                print("%s %s failed with %d after it may have reached GitHub, not sending it again"%(method, path, response.status_code))
+                break
+            failures += 1
+            delay = self.retry_policy.delay(failures)
+            print("%s %s failed with %d, retrying in %.1f seconds (%d of %d)"%(method, path, response.status_code, delay, failures, self.retry_policy.max_attempts))
+            sleep(delay)
+
+        self.stats.finish(endpoint, response)
+        return response
+
+    #the senders all look at a response, so a request that didn't get one gets a stand-in saying what went wrong - and whether it
+    #could have reached GitHub before it did (see failed_post_status)
+    @staticmethod
+    def failed_response(url, error, reached=True):
+        response = requests.Response()
+        response.status_code = network_error_status
+        response.url = url
+        response._content = str(error).encode("utf-8")
+        response.reached = reached
+        return response
+
+    #a transport for another repository that sends through this one's connections, tokens, rate budget and circuit breaker,
+    #with stats of its own - limiter can put it behind something that hands out this one's rate budget
+    def for_repo(self, owner, repo, limiter=None, stats=None):
+        view = copy.copy(self)
+        view.repo_url = "%s/repos/%s/%s"%(self.api_url, owner, repo)
+        view.limiter = limiter or self.limiter
+        view.stats = stats or Transport_Stats()
+        view.shared = True
+        return view
+
+    def close(self):
+        if not self.shared:
+            self.session.close()
+
+github_transport = GitHub_Transport(GH_TOKENS) #shared by every sender
+
+#What github has told us about one issue import
+class Import_Status:
+    def __init__(self, issue_obj, import_id, created_at, follow_ups=()):
+        self.issue = issue_obj
+        self.follow_ups = follow_ups #comments that didn't fit in the import, posted once it is done
+        self.import_id = import_id
+        self.created_at = created_at
+        self.state = "pending" #pending, imported or failed
+        self.new_issue_id = None
+        self.errors = None
+        self.failed_checks = 0 #polls of its own status that failed
+        self.submitted = monotonic()
+
+#Keeps track of every issue import we have submitted and polls the pending ones in one batch request (GET /import/issues?since=...),
+#sent with If-None-Match so an unchanged listing comes back as a 304 that doesn't count against the quota.
+class Import_Status_Tracker:
+    def __init__(self, interval=IMPORT_STATUS_INTERVAL, max_failures=IMPORT_STATUS_MAX_FAILURES, timeout=IMPORT_STATUS_TIMEOUT):
+        self.interval = interval
+        self.max_failures = max_failures
+        self.timeout = timeout
+        self.failed_polls = 0 #listing polls in a row that failed
+        self.imports = {} #import id -> Import_Status
+        self.by_issue = {} #record key -> Import_Status
+        self.out_of_order = [] #(issue, issue it should have come after) for imports github numbered out of order
+        self.etag = None
+        self.etag_since = None
+        self.last_poll = 0.0
+        self.polling = None
+        self.lock = threading.Lock()
+
+    #remember an import from the body of its 202 response
+    def record(self, issue_obj, status_json, follow_ups=()):
+        status = Import_Status(issue_obj, status_json['id'], status_json.get('created_at'), follow_ups)
+        with self.lock:
+            self.imports[status.import_id] = status
+            self.by_issue[issue_obj.key] = status
+        self.update(status_json)
+
+    def update(self, status_json):
+        status = self.imports.get(status_json['id'])
+        if status is None or status.state != "pending":
+            return
+
+        if status_json['status'] == "imported":
+            status.new_issue_id = import_issue_number(status_json)
+            status.issue.new_issue_id = status.new_issue_id
+            status.state = "imported"
+            import_journal.record(*status.issue.key, status="imported", github_number=status.new_issue_id)
+            reference_index.add(*status.issue.key, number=status.new_issue_id)
+        elif status_json['status'] == "failed":
+            status.errors = status_json.get('errors')
+            status.state = "failed"
+            import_journal.record(*status.issue.key, status="failed")
+            print('Import of Issue "%s" failed' % status.issue.title)
+            print('Errors:', status.errors)
+
+    def pending(self):
+        with self.lock:
+            return [status for status in self.imports.values() if status.state == "pending"]
+
+    #one request for the status of everything still pending - if the listing keeps failing, one for each of them
+    def poll(self):
+        pending = []
+        for status in self.pending():
+            if monotonic() - status.submitted >= self.timeout:
+                self.give_up(status, "it was still pending after %g seconds" % self.timeout)
+            else:
+                pending.append(status)
+        if not pending:
+            return
+        if self.failed_polls >= self.max_failures:
+            self.poll_each(pending)
+            return
+
+        since = min(str(status.created_at) for status in pending)
+        headers = {}
+        if self.etag is not None and since == self.etag_since:
+            headers["If-None-Match"] = self.etag
+
+        response = github_transport.request("GET", "import_issues", "/import/issues?since=%s" % since, headers=headers)
+        if response.status_code == 304:
+            return
+        if response.status_code != 200:
+            print('Could not check issue import statuses')
+            print('Response:', response.content)
+            self.failed_polls += 1
+            if self.failed_polls >= self.max_failures:
+                print("Checking each import's own status from now on")
+            return
+
+        self.failed_polls = 0
+        self.etag = response.headers.get("ETag")
+        self.etag_since = since
+        for status_json in json.loads(response.content):
+            self.update(status_json)
+
+    #An import whose status can't be had (or that github takes too long over) is given up on for this run. Its journal entry stays
+    #"sent", so the next run checks it again (see Import_Journal.resolve_sent) instead of sending it a second time.
+    def give_up(self, status, reason):
+        status.state = "failed"
+        status.errors = "%s, the next run checks it again" % reason
+        print('Gave up waiting for the import of Issue "%s"' % status.issue.title)
+
+    def poll_each(self, pending):
+        for status in pending:
+            response = github_transport.request("GET", "import_issues", "/import/issues/%d" % status.import_id)
+            if response.status_code == 200:
+                self.update(json.loads(response.content))
+                continue
+
+            status.failed_checks += 1
+            if status.failed_checks >= self.max_failures:
+                self.give_up(status, "its status couldn't be checked (%d)" % response.status_code)
+
+    #returns (state, new issue number, errors) for an issue we have submitted
+    def state(self, issue_obj):
+        status = self.by_issue.get(issue_obj.key)
+        if status is None:
+            return None
+        return status.state, status.new_issue_id, status.errors
+
+    def failures(self):
+        return [status for status in self.imports.values() if status.state == "failed"]
+
+    #wait until github has finished with this issue's import - everyone waiting shares the same poll, at most one per interval
+    async def wait_for(self, issue_obj, loop, executor):
+        status = self.by_issue[issue_obj.key]
+        while status.state == "pending":
+            if self.polling is None:
+                self.polling = asyncio.ensure_future(self.refresh(loop, executor))
+            await asyncio.shield(self.polling)
+
+    async def refresh(self, loop, executor):
+        try:
+            wait = self.last_poll + self.interval - monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await loop.run_in_executor(executor, self.poll)
+        finally:
+            self.last_poll = monotonic()
+            self.polling = None
+
+import_tracker = Import_Status_Tracker() #every issue import submitted this run
+
+#the number github gave the issue of a finished import
+def import_issue_number(status_json):
+    return int(status_json['issue_url'].rstrip("/").split("/")[-1])
+
 #METHODS --------------------------------------------------------------------
 
-def load_project_file(filename):
-    print("Loading Project JSON File...")
+#yields (array name, record) for every element of the export's top level arrays, or only for the arrays named in datatypes
+def stream_export_records(filename, datatypes=None):
+    with open_export(filename) as f:
+        stream = Export_Stream(f)
 
-    with open(filename, 'r') as f:
-        full_json_in = json.load(f)
+        for key in stream.object_keys():
+            if (datatypes is None or key in datatypes) and stream.peek() == "[":
+                for record in stream.array_items():
+                    yield key, record
+            else:
+                stream.skip_value()
 
-    print("Success\n")
-    return full_json_in
+def load_project_file(filename):
+    print("Streaming Project JSON File...")
+    return stream_export_records(filename)
 
+#yields one record at a time from the given top level array (e.g. "issues" or "merge_requests") of an export file
 def load_data_file(filename, datatype):
-    print("Loading %s JSON File..."%datatype)
-
-    with open(filename, "r") as f:
-        json_in = json.load(f)[datatype]
+    print("Streaming %s JSON File..."%datatype)
 
-    print("Success\n")
-    return json_in
+    for key, record in stream_export_records(filename, (datatype,)):
+        yield record
 
 # issue author names are not stored in the export - but it is stored when they make notes or comments, so this searches for notes and comments to find ID/Author pairs
 # as a backup it also looks at the project members area but this doesn't have full names, nor does it have a history of anyone who has ever been a member  - just who is currently one.
-def find_author_id_pairs(root):
-    for key in root:
-        if type(root[key]) == list:
-            for item in root[key]:
-                if type(item) is dict:
-                    if "notes" in item:
-                        for note in item["notes"]:
-                            author_id = note["author_id"]
-                            author_name = note["author"]["name"]
-
-                            if author_id not in author_id_map:
-                                author_id_map[author_id] = author_name
-                    if "user" in item:
-                        user_id = item['user']['id']
-                        user_name = item['user']['username']
-
-                        if user_id not in secondary_author_id_map:
-                            secondary_author_id_map[user_id] = user_name
+def add_author_id_pairs(item):
+    if type(item) is dict:
+        if "notes" in item:
+            for note in item["notes"]:
+                author_id = note["author_id"]
+                author_name = note["author"]["name"]
+
+                if author_id not in author_id_map:
+                    author_id_map[author_id] = author_name
+        if "user" in item:
+            user_id = item['user']['id']
+            user_name = item['user']['username']
+
+            if user_id not in secondary_author_id_map:
+                secondary_author_id_map[user_id] = user_name
+
+def find_author_id_pairs(records):
+    for key, item in records:
+        add_author_id_pairs(item)
+
+unknown_issue_author = "Not recorded"
+unknown_mr_author = "Not Recorded - See Original Link"
+
+def resolve_author(author_id, fallback):
+    if (author_id in author_id_map):
+        return author_id_map[author_id]
+    elif (author_id in secondary_author_id_map):
+        return secondary_author_id_map[author_id]
+    else:
+        return fallback
+
+#the author index is only good for the exact export file it was built from
+def load_author_cache(filename):
+    cache_filename = filename + AUTHOR_CACHE_SUFFIX
+    if not os.path.exists(cache_filename):
+        return False
+
+    with open(cache_filename, "r") as f:
+        cache = json.load(f)
+
+    stat = os.stat(filename)
+    if cache.get('size') != stat.st_size or cache.get('mtime') != stat.st_mtime:
+        return False
+
+    #stored as pairs rather than objects so the ids keep their types
+    author_id_map.update((author_id, name) for author_id, name in cache['author_id_map'])
+    secondary_author_id_map.update((user_id, name) for user_id, name in cache['secondary_author_id_map'])
+    return True
+
+def save_author_cache(filename):
+    stat = os.stat(filename)
+    cache = {'size': stat.st_size,
+             'mtime': stat.st_mtime,
+             'author_id_map': list(author_id_map.items()),
+             'secondary_author_id_map': list(secondary_author_id_map.items())}
+
+    with open(filename + AUTHOR_CACHE_SUFFIX, "w") as f:
+        json.dump(cache, f)
+
+#Where every issue and MR is in an export: [array name, iid, byte offset, length in bytes, state, updated_at] each, in file order.
+#The file is read as latin-1 so that every byte is one character and positions in the text are byte offsets - everything the index
+#keeps is ASCII, and the records are decoded properly when they are read back. Only uncompressed exports can be indexed, since
+#those are the only ones a record can be read out of without reading everything before it.
+def build_export_index(filename):
+    print("Indexing %s..." % filename)
+    entries = []
+    with open(filename, "r", encoding="latin-1", newline="") as f:
+        stream = Export_Stream(f)
+        for key in stream.object_keys():
+            if key in ("issues", "merge_requests") and stream.peek() == "[":
+                for start, end, record in stream.array_spans():
+                    entries.append([key, record['iid'], start, end - start, record.get('state'), record.get('updated_at')])
+            else:
+                stream.skip_value()
+    return entries
+
+#the index of an export, built and saved next to it if it isn't there yet or the export has changed since
+def load_export_index(filename):
+    if filename.lower().endswith((".gz", ".zst", ".zstd") + archive_suffixes):
+        raise ValueError("%s is compressed - selecting records needs an uncompressed export" % filename)
+
+    index_filename = filename + EXPORT_INDEX_SUFFIX
+    stat = os.stat(filename)
+    if os.path.exists(index_filename):
+        with open(index_filename, "r") as f:
+            index = json.load(f)
+        if index.get('size') == stat.st_size and index.get('mtime') == stat.st_mtime:
+            return index['records']
+
+    entries = build_export_index(filename)
+    with open(index_filename + ".partial", "w") as f:
+        json.dump({'size': stat.st_size, 'mtime': stat.st_mtime, 'records': entries}, f)
+    os.replace(index_filename + ".partial", index_filename)
+    return entries
+
+#decodes just the given index entries, in file order
+def read_indexed_records(filename, entries):
+    with open(filename, "rb") as f:
+        for entry in sorted(entries, key=lambda entry: entry[2]):
+            f.seek(entry[2])
+            yield json.loads(f.read(entry[3]))
+
+#Turns --iids and --failed-from into a test of (kind, iid) pairs. iids is a comma separated list of numbers and ranges, e.g. "120-180,200",
+#which picks both issues and MRs with those iids unless prefixed with # (issues only) or ! (MRs only). failed_from is a journal file,
+#and picks everything that failed to import in it.
+def import_selection(iids=None, failed_from=None):
+    ranges = []
+    for part in (iids or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        kind = {"#": "issue", "!": "mr"}.get(part[0])
+        if kind is not None:
+            part = part[1:]
+        low, _, high = part.partition("-")
+        ranges.append((kind, int(low), int(high or low)))
+
+    failed = set()
+    if failed_from is not None:
+        db = sqlite3.connect(failed_from)
+        try:
+            failed.update(db.execute("SELECT kind, key FROM journal WHERE status = 'failed' AND kind IN ('issue', 'mr')"))
+            #...and the ones whose follow-up comments failed, which the run posts again (see Import_Journal.track_follow_up)
+            failed.update(tuple(key.split(":")[:2]) for key, in db.execute("SELECT key FROM journal WHERE status = 'failed' AND kind = 'follow_up'"))
+        finally:
+            db.close()
+
+    def selected(kind, iid):
+        if (kind, str(iid)) in failed:
+            return True
+        return any((range_kind is None or range_kind == kind) and low <= int(iid) <= high for range_kind, low, high in ranges)
+
+    return selected
+
+#The same as parse_export, but only for the issues and MRs the selection picks, which are read straight out of the export through its
+#index. Returns (issues, MRs, keys of everything in the export) - the last so references to what wasn't selected still resolve.
+def parse_selected(selected, project_filename, issues_filename=None, merges_filename=None, record_filter=None):
+    issue_list = []
+    mr_list = []
+    keys = []
+    system_note_filter.reset()
+    label_catalog.labels.clear()
+
+    if load_author_cache(project_filename):
+        print("Loaded %d authors from %s%s\n" % (len(author_id_map) + len(secondary_author_id_map), project_filename, AUTHOR_CACHE_SUFFIX))
+    else:
+        find_author_id_pairs(load_project_file(project_filename))
+        save_author_cache(project_filename)
+
+    for filename, datatype, kind in ((issues_filename or project_filename, "issues", "issue"), (merges_filename or project_filename, "merge_requests", "mr")):
+        entries = [entry for entry in load_export_index(filename) if entry[0] == datatype]
+        keys.extend((kind, str(entry[1])) for entry in entries)
+
+        for item in read_indexed_records(filename, [entry for entry in entries if selected(kind, entry[1])]):
+            if record_filter is not None and not record_filter.matches(datatype, item):
+                continue
+            if IMPORT_LABELS:
+                label_catalog.add_links(item)
+            if kind == "issue":
+                issue_list.append(parse_issue(item))
+            else:
+                mr_list.append(parse_mr(item))
+
+    print("Selected %d Issues and %d MRs out of %d\n" % (len(issue_list), len(mr_list), len(keys)))
+    if record_filter is not None:
+        record_filter.report()
+    system_note_filter.report()
+    return issue_list, mr_list, keys
+
+#One pass over the export that builds the author index and parses the issues and merge requests in it at the same time.
+#A record whose author only turns up later in the file is given a placeholder and patched once the pass is done - cheap since
+#the header with the author in it isn't built until the record is serialized. Issues/MRs can come from separate files instead.
+#record_filter (a Record_Filter) leaves out the records that don't pass it before they are parsed
+def parse_export(project_filename, issues_filename=None, merges_filename=None, workers=None, record_filter=None):
+    if workers is None:
+        workers = PARSE_WORKERS
+
+    issue_list = []
+    mr_list = []
+    unresolved = [] #(record, author id, fallback) for records that didn't get a full author name when they were parsed
+    system_note_filter.reset()
+    label_catalog.labels.clear()
+
+    cached = load_author_cache(project_filename)
+    if cached:
+        print("Loaded %d authors from %s%s\n" % (len(author_id_map) + len(secondary_author_id_map), project_filename, AUTHOR_CACHE_SUFFIX))
+    elif record_filter is not None and record_filter.needs_authors:
+        #filtering by author can't wait for the names to turn up part way through the pass
+        find_author_id_pairs(load_project_file(project_filename))
+        save_author_cache(project_filename)
+        cached = True
+
+    project_parse = set()
+    if issues_filename is None:
+        project_parse.add("issues")
+    if merges_filename is None:
+        project_parse.add("merge_requests")
+
+    #(filename, arrays to stream - None for all of them, arrays to parse, whether to collect authors from it)
+    sources = []
+    if not cached:
+        sources.append((project_filename, None, project_parse, True))
+    elif project_parse:
+        sources.append((project_filename, project_parse, project_parse, False))
+    if issues_filename is not None:
+        sources.append((issues_filename, ("issues",), ("issues",), False))
+    if merges_filename is not None:
+        sources.append((merges_filename, ("merge_requests",), ("merge_requests",), False))
+
+    #with a process pool the workers parse against a snapshot of the author maps, so anything not in the snapshot is patched afterwards
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_parse_worker, initargs=(dict(author_id_map), dict(secondary_author_id_map), dict(system_note_filter.actions)))
+        known_authors = frozenset(author_id_map)
+        in_flight = deque()
+        chunk = []
+
+        def collect(result):
+            parsed, note_counts = result
+            system_note_filter.merge(note_counts)
+            for key, record, author_id in parsed:
+                if key == "issues":
+                    issue_list.append(record)
+                    fallback = unknown_issue_author
+                else:
+                    mr_list.append(record)
+                    fallback = unknown_mr_author
+
+                if author_id not in known_authors:
+                    unresolved.append((record, author_id, fallback))
+
+    try:
+        for filename, datatypes, parse, find_authors in sources:
+            print("Streaming %s..." % filename)
+
+            for key, item in stream_export_records(filename, datatypes):
+                if find_authors:
+                    add_author_id_pairs(item)
+
+                if key not in parse:
+                    continue
+
+                if record_filter is not None and not record_filter.matches(key, item):
+                    continue
+
+                if IMPORT_LABELS:
+                    label_catalog.add_links(item)
+
+                if pool is not None:
+                    chunk.append((key, item))
+                    if len(chunk) >= PARSE_CHUNK_SIZE:
+                        in_flight.append(pool.submit(parse_chunk, chunk))
+                        chunk = []
+                        #results are collected in submission order, and only a couple of chunks per worker are kept waiting
+                        if len(in_flight) > 2 * workers:
+                            collect(in_flight.popleft().result())
+                    continue
+
+                if key == "issues":
+                    record = parse_issue(item)
+                    issue_list.append(record)
+                    fallback = unknown_issue_author
+                else:
+                    record = parse_mr(item)
+                    mr_list.append(record)
+                    fallback = unknown_mr_author
+
+                if item['author_id'] not in author_id_map:
+                    unresolved.append((record, item['author_id'], fallback))
+
+        if pool is not None:
+            if chunk:
+                in_flight.append(pool.submit(parse_chunk, chunk))
+            while in_flight:
+                collect(in_flight.popleft().result())
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if not cached:
+        save_author_cache(project_filename)
+
+    for record, author_id, fallback in unresolved:
+        record.orig_author = resolve_author(author_id, fallback)
+
+    print("Processed %d Issues and %d MRs (%d authors patched after the pass, %d labels)\n" % (len(issue_list), len(mr_list), len(unresolved), len(label_catalog.labels)))
+    if record_filter is not None:
+        record_filter.report()
+    system_note_filter.report()
+    return issue_list, mr_list
 
 
 #create an issue object from a single issue from the json file
@@ -220,13 +2318,7 @@ def parse_issue(issue_raw):
     issue_title = issue_raw['title']
     
     #Issue Author
-    issue_author_id = issue_raw['author_id']
-    if (issue_author_id in author_id_map):
-        issue_author = author_id_map[issue_author_id]
-    elif (issue_author_id in secondary_author_id_map):
-        issue_author = secondary_author_id_map[issue_author_id]
-    else:
-        issue_author = "Not recorded"
+    issue_author = resolve_author(issue_raw['author_id'], unknown_issue_author)
 
     #Issue Body
     issue_body = issue_raw['description']
@@ -235,9 +2327,9 @@ def parse_issue(issue_raw):
     orig_issue_id = str(issue_raw['iid'])
 
     #Timestamps
-    created_at = str(issue_raw['created_at'])
-    updated_at = str(issue_raw['updated_at'])
-    closed_at = str(issue_raw['closed_at']) #weirdly sometimes the issue can be closed without this being set :\
+    created_at = issue_raw['created_at']
+    updated_at = issue_raw['updated_at']
+    closed_at = issue_raw['closed_at'] #weirdly sometimes the issue can be closed without this being set :\
 
     #is_closed set
     closed_status = str(issue_raw['state'])
@@ -247,23 +2339,43 @@ def parse_issue(issue_raw):
     else:
         is_closed = False
 
+    #Labels - just the names, the catalog has the rest
+    labels = label_names(issue_raw) if IMPORT_LABELS else ()
+
     #Create the issue object
-    new_issue = Issue(title=issue_title, orig_author=issue_author, orig_body=issue_body, orig_issue_id=orig_issue_id, created_at=created_at, updated_at=updated_at, closed_at=closed_at, closed=is_closed)
+    new_issue = Issue(title=issue_title, orig_author=issue_author, orig_body=issue_body, orig_issue_id=orig_issue_id, created_at=created_at, updated_at=updated_at, closed_at=closed_at, closed=is_closed, labels=labels)
     
     #populate its notes
-    for note_json in issue_raw['notes']:
-        note_author = note_json['author']['name']
-        note_timestamp = note_json['updated_at']
-        note_body = note_json['note']
-
-        new_note = Note(note_author, note_timestamp, note_body)
+    attachments = note_attachment_links(issue_raw['notes'])
+    for note_author, note_timestamp, note_body, note_id in system_note_filter.filter(issue_raw['notes']):
+        new_note = Note(note_author, note_timestamp, note_body + attachments.get(note_id, ""), note_id)
 
         new_issue.add_note(new_note)
     
     
     return new_issue
 
-#Parse all isues from the issues specific json file
+#parse workers get their own read-only copy of the author maps and the system note settings
+def init_parse_worker(primary_authors, secondary_authors, note_actions):
+    author_id_map.clear()
+    author_id_map.update(primary_authors)
+    secondary_author_id_map.clear()
+    secondary_author_id_map.update(secondary_authors)
+    system_note_filter.actions = note_actions
+
+#runs in a parse worker - returns (array name, parsed record, author id) in the order the raw records were given, and what the system note
+#filter removed from them
+def parse_chunk(chunk):
+    system_note_filter.reset()
+    parsed = []
+    for key, item in chunk:
+        if key == "issues":
+            parsed.append((key, parse_issue(item), item['author_id']))
+        else:
+            parsed.append((key, parse_mr(item), item['author_id']))
+    return parsed, system_note_filter.counts
+
+#Parse all isues as they are streamed out of the issues specific json file
 def process_issues(json_in):
     print("Processing Issues...")
     
@@ -284,13 +2396,7 @@ def parse_mr(mr_raw):
     target_branch = mr_raw['target_branch']
 
 
-    mr_author_id = mr_raw['author_id']
-    if (mr_author_id in author_id_map):
-        mr_author = author_id_map[mr_author_id]
-    elif (mr_author_id in secondary_author_id_map):
-        mr_author = secondary_author_id_map[mr_author_id]
-    else:
-        mr_author = "Not Recorded - See Original Link"
+    mr_author = resolve_author(mr_raw['author_id'], unknown_mr_author)
 
     #merge body
     mr_body = mr_raw['description']
@@ -299,29 +2405,35 @@ def parse_mr(mr_raw):
     orig_mr_id = str(mr_raw['iid'])
 
     #Timestamps
-    created_at = str(mr_raw['created_at'])
-    updated_at = str(mr_raw['updated_at'])
+    created_at = mr_raw['created_at']
+    updated_at = mr_raw['updated_at']
 
     #status
     state = str(mr_raw['state'])
     if state == "opened":
         state = "open"
 
-    #create new MR object
-    new_mr = Merge_Request(title=mr_title, orig_author=mr_author,orig_body=mr_body, orig_mr_id=orig_mr_id, created_at=created_at, updated_at=updated_at, state=state, head_branch=head_branch, target_branch=target_branch)
+    #when it was merged or closed, if GitLab kept track - otherwise the last update is as close as we can get
+    closed_at = None
+    if state != "open":
+        metrics = mr_raw.get('metrics') or {}
+        closed_at = metrics.get('merged_at') or metrics.get('latest_closed_at') or updated_at
 
-    for note_json in mr_raw['notes']:
-        note_author = note_json['author']['name']
-        note_timestamp = note_json['updated_at']
-        note_body = note_json['note']
+    labels = label_names(mr_raw) if IMPORT_LABELS else ()
 
-        new_note = Note(note_author, note_timestamp, note_body)
+    #create new MR object
+    new_mr = Merge_Request(title=mr_title, orig_author=mr_author,orig_body=mr_body, orig_mr_id=orig_mr_id, created_at=created_at, updated_at=updated_at, state=state, head_branch=head_branch, target_branch=target_branch, closed_at=closed_at, labels=labels)
+
+    #open MRs become pull requests, which get a request per note
+    attachments = note_attachment_links(mr_raw['notes'])
+    for note_author, note_timestamp, note_body, note_id in system_note_filter.filter(mr_raw['notes'], posted_separately=(state == "open")):
+        new_note = Note(note_author, note_timestamp, note_body + attachments.get(note_id, ""), note_id)
 
         new_mr.add_note(new_note)
 
     return new_mr
 
-#Parse all MRs from MR specific json file
+#Parse all MRs as they are streamed out of the MR specific json file
 def process_merge_requests(json_in):
     print("Processing MRs...")
     
@@ -335,120 +2447,539 @@ def process_merge_requests(json_in):
     return mr_list
 
 def create_github_issue(issue_obj):
-    #issue import URL
-    url = 'https://api.github.com/repos/%s/%s/import/issues' % (GH_OWNER, GH_REPO)
-
-    #Headers - required to use the API per GitHub's requirements
-    headers = {
-        "Authorization": "token %s" % GH_TOKEN,
-        "Accept": "application/vnd.github.golden-comet-preview+json"
-    }
-
     #Payload
-    data = issue_obj.to_json()
-
-    #Add the issue to our repository
-    response = requests.request("POST", url, data=data, headers=headers)
+    data, unresolved = reference_index.count_unresolved(issue_obj.to_import_json)
+    data, follow_ups = plan_import_payload(data)
+    if follow_ups:
+        print('Issue "%s" is too big for one import - %d comments will follow it' % (issue_obj.title, len(follow_ups)))
+
+    #Add the issue to our repository - it is in doubt until we hear back, so a crash in between doesn't get it sent twice
+    plan_follow_up_comments(follow_up_prefix(issue_obj), follow_ups)
+    import_journal.record(*issue_obj.key, status="unknown", payload=data)
+    response = github_transport.request("POST", "import_issues", "/import/issues", data=data)
     if response.status_code == 202:
         print('Successfully created Issue "%s"' % issue_obj.title)
+        status_json = json.loads(response.content)
+        import_journal.record(*issue_obj.key, status="sent", import_id=status_json['id'], payload=data)
+        import_tracker.record(issue_obj, status_json, follow_ups) #github processes the import in the background
+        if unresolved:
+            reference_index.defer(issue_obj, data)
+        return True
     else:
         print('Could not create Issue "%s"' % issue_obj.title)
         print('Response:', response.content)
+        import_journal.record(*issue_obj.key, status=failed_post_status(response), payload=data)
+        return False
+
+#Keeps up to `window` imports processing on GitHub at once. Issues are submitted strictly in the order given, and the window only slides
+#once the oldest import in it is confirmed with its new number. With the default window of 1 every issue waits for the one before it to
+#have its number, so they are numbered in order. A bigger window is an opt-in that doesn't promise that: github doesn't have to process
+#imports in the order they arrive, so the numbers are checked as they come back, and the first time one is out of order the window drops
+#to 1 for the rest. The issues that were already in flight and came out of order can't be fixed - they are kept in
+#import_tracker.out_of_order to be reported.
+async def import_github_issues(sorted_issue_list, window=None):
+    if window is None:
+        window = IMPORT_WINDOW #read when called, so it can be changed after the script is loaded
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=window + 1)
+
+    in_flight = deque()
+    last_issue = None
+
+    async def commit_oldest():
+        nonlocal last_issue, window
+        issue, confirmation = in_flight.popleft()
+        await confirmation
+
+        if issue.new_issue_id is None:
+            return
+        follow_ups = import_tracker.by_issue[issue.key].follow_ups
+        if follow_ups and not await loop.run_in_executor(executor, post_follow_up_comments, issue, follow_up_prefix(issue), follow_ups):
+            print('Issue "%s" is missing comments, the next run posts them' % issue.title)
+        if last_issue is not None and issue.new_issue_id < last_issue.new_issue_id:
+            print('Issue "%s" was imported as #%d, before #%d - it is out of order' % (issue.title, issue.new_issue_id, last_issue.new_issue_id))
+            import_tracker.out_of_order.append((issue, last_issue))
+            if window > 1:
+                print("GitHub is processing imports out of order, sending the rest one at a time")
+                window = 1
+        else:
+            last_issue = issue
+
+    for issue in sorted_issue_list:
+        while len(in_flight) >= window:
+            await commit_oldest()
+
+        #submission itself is one at a time so github receives the imports in order
+        if await loop.run_in_executor(executor, create_github_issue, issue):
+            in_flight.append((issue, asyncio.ensure_future(import_tracker.wait_for(issue, loop, executor))))
+
+    while in_flight:
+        await commit_oldest()
+
+    executor.shutdown()
+
+
+#where the follow-up comments of a record's own payload, or of one of its notes, are journaled (see Import_Journal.track_follow_up)
+def follow_up_prefix(record, note=None):
+    if note is None:
+        return "%s:%s" % record.key
+    return "%s:%s:note:%s" % (record.key + (note.note_id,))
+
+#journals the follow-up comments a payload is about to leave out before it is sent, so a run that stops before they are all posted
+#leaves them missing rather than forgotten
+def plan_follow_up_comments(prefix, bodies):
+    for n in range(len(bodies)):
+        if not import_journal.done("follow_up", "%s:%d" % (prefix, n)):
+            import_journal.record("follow_up", "%s:%d" % (prefix, n), "pending")
+
+#the parts of an oversized payload that were left out of it, posted as comments once the issue or pull request has a number. Each is
+#journaled under prefix, so parts that are already on github are skipped, and it stops at the first one that doesn't make it (or may
+#have) so the rest never go up out of order - returns False if any are still missing
+def post_follow_up_comments(record, prefix, bodies):
+    path = '/issues/%d/comments' % record.new_issue_id
+    for n, body in enumerate(bodies):
+        key = "%s:%d" % (prefix, n)
+        if import_journal.done("follow_up", key):
+            continue
+        if import_journal.unresolved("follow_up", key): #left for someone to check, see --resend-unknown
+            return False
+
+        import_journal.record("follow_up", key, "unknown", github_number=record.new_issue_id)
+        response = github_transport.request("POST", "issue_comments", path, data=json.dumps({"body": body}))
+        if response.status_code != 201:
+            print('Could not add the rest of "%s" to %d' % (record.title, record.new_issue_id))
+            print('Response:', response, response.content)
+            import_journal.record("follow_up", key, failed_post_status(response))
+            return False
+        import_journal.record("follow_up", key, "created")
+    return True
+
+#posts what earlier runs left missing of the follow-up comments of this record and its notes, with the bodies planned again the way
+#they were when it was sent
+def post_missing_follow_up_comments(record):
+    if record.key[0] == "mr" and record.state == "open":
+        bodies = plan_body_payload(record.to_json())[1]
+    else:
+        bodies = plan_import_payload(record.to_import_json())[1]
+    posted = post_follow_up_comments(record, follow_up_prefix(record), bodies)
 
+    for note in record.notes:
+        if import_journal.done("note", note.note_id):
+            bodies = plan_body_payload(note.to_json())[1]
+            posted = post_follow_up_comments(record, follow_up_prefix(record, note), bodies) and posted
+    return posted
 
-def create_github_pull_request(mr_object):
-
-    url = 'https://api.github.com/repos/%s/%s/pulls' % (GH_OWNER, GH_REPO)
-
-    headers = {
-        "Authorization": "token %s" % GH_TOKEN,
-        "Accept": "application/vnd.github.sailor-v-preview+json"
-    }
 
-    data = mr_object.to_json()
+def create_github_pull_request(mr_object):
+    data, unresolved = reference_index.count_unresolved(mr_object.to_json)
+    data, follow_ups = plan_body_payload(data)
 
-    response = requests.request("POST", url, data=data, headers=headers)
+    plan_follow_up_comments(follow_up_prefix(mr_object), follow_ups)
+    import_journal.record("mr", mr_object.orig_mr_id, "unknown", payload=data) #in doubt until we hear back, see create_github_issue
+    response = github_transport.request("POST", "pulls", "/pulls", data=data)
     if response.status_code == 201:
         print('Successfully created MR "%s"' % mr_object.title)
         json_response = json.loads(response.content)
         mr_object.new_issue_id = json_response['number'] #set the new issue ID so we can know where to post comments
+        import_journal.record("mr", mr_object.orig_mr_id, "created", github_number=mr_object.new_issue_id, payload=data)
+        reference_index.add("mr", mr_object.orig_mr_id, mr_object.new_issue_id)
+        if unresolved:
+            reference_index.defer(mr_object, data)
+        if follow_ups and not post_follow_up_comments(mr_object, follow_up_prefix(mr_object), follow_ups):
+            print('MR "%s" is missing comments, the next run posts them' % mr_object.title)
+        if mr_object.labels:
+            set_github_labels(mr_object.new_issue_id, mr_object.labels)
     else:
         print('Could not create MR "%s"' % mr_object.title)
         print('Response:', response, response.content)
+        import_journal.record("mr", mr_object.orig_mr_id, failed_post_status(response), payload=data)
+
 
 
 
+def set_github_labels(number, labels):
+    response = github_transport.request("POST", "issues", "/issues/%d/labels" % number, data=json.dumps({"labels": list(labels)}))
+    if response.status_code != 200:
+        print("Could not set the labels of %d" % number)
+        print('Response:', response, response.content)
 
 def add_github_pull_request_comments(mr_object):
-    new_pr_id = mr_object.new_issue_id
+    return add_github_comments(mr_object, mr_object.notes)
 
-    url = 'https://api.github.com/repos/%s/%s/issues/%s/comments' % (GH_OWNER, GH_REPO, str(new_pr_id))
+#posts notes as comments on the issue or pull request a record became - returns False if any of them couldn't be
+def add_github_comments(mr_object, notes):
+    new_pr_id = mr_object.new_issue_id
+    succeeded = True
 
-    headers = {
-        "Authorization": "token %s" % GH_TOKEN,
-        "Accept": "application/vnd.github.sailor-v-preview+json"
-    }
+    path = '/issues/%s/comments' % str(new_pr_id)
 
-    sorted_notes = sorted(mr_object.notes, key=lambda x: str(x.timestamp), reverse=False)
+    sorted_notes = sorted(notes, key=lambda x: str(x.timestamp), reverse=False)
 
     for note in sorted_notes:
-        data = note.to_json()
-        response = requests.request("POST", url, data=data, headers=headers)
+        if import_journal.done("note", note.note_id):
+            continue
+        if import_journal.unresolved("note", note.note_id): #left for someone to check, see --resend-unknown
+            succeeded = False
+            continue
+
+        data, unresolved = reference_index.count_unresolved(note.to_json)
+        data, follow_ups = plan_body_payload(data) #a note too long for one comment carries on in the next ones
+        plan_follow_up_comments(follow_up_prefix(mr_object, note), follow_ups)
+        import_journal.record("note", note.note_id, "unknown", github_number=new_pr_id, payload=data)
+        response = github_transport.request("POST", "issue_comments", path, data=data)
 
         if response.status_code == 201:
             print("Successfully added comment to %d"%(new_pr_id))
+            import_journal.record("note", note.note_id, "created", github_number=new_pr_id, payload=data)
+            if unresolved:
+                reference_index.defer_comment(mr_object, note, json.loads(data)['body'], json.loads(response.content).get('id'))
+            if follow_ups and not post_follow_up_comments(mr_object, follow_up_prefix(mr_object, note), follow_ups):
+                succeeded = False
         else:
             print("Could not add comment to %d"%(new_pr_id))
             print('Response:', response,response.content)
-
-
-def main():
-
-    #This gets us author names pulled from various actions since the creating author is not kept
-    full_json_in = load_project_file("../export/project.json")
-    find_author_id_pairs(full_json_in)
-
-    #load issues file
-    issue_json_in = load_data_file("../export/issues.json","issues")
-    issue_list = process_issues(issue_json_in)
-
-    #load merge requests file
-    mr_json_in = load_data_file("../export/merges.json","merge_requests")
-    mr_list = process_merge_requests(mr_json_in)
+            import_journal.record("note", note.note_id, failed_post_status(response), github_number=new_pr_id, payload=data)
+            succeeded = False
+
+    return succeeded
+
+
+#ids of an issue's comments in the order they were created, which for an import is the order its notes were sent in
+def list_github_issue_comment_ids(number):
+    comment_ids = []
+    page = 1
+    while True:
+        response = github_transport.request("GET", "issue_comments", "/issues/%d/comments?per_page=100&page=%d" % (number, page))
+        if response.status_code != 200:
+            print("Could not list the comments on %d" % number)
+            print('Response:', response, response.content)
+            return None
+
+        comments = json.loads(response.content)
+        comment_ids.extend(comment['id'] for comment in comments)
+        if len(comments) < 100:
+            return comment_ids
+        page += 1
+
+#Brings an issue or MR that was synced before up to date with the export: notes that weren't there at the last sync are added as comments
+#to what it became on GitHub, and if it has been closed (or merged) or reopened since, so is that. Edits to the title, description or
+#existing notes are not carried over. Returns False if any of it failed.
+def sync_github_changes(record, previous, state):
+    activity, content_hash, previous_state, note_ids = previous
+    known = set(note_ids)
+    new_notes = [note for note in record.notes if note.note_id not in known and not import_journal.done("note", note.note_id)]
+
+    succeeded = True
+    if new_notes:
+        print("Adding %d new notes to %d" % (len(new_notes), record.new_issue_id))
+        succeeded = add_github_comments(record, new_notes)
+
+    if (previous_state == "open") != (state == "open"):
+        github_state = "open" if state == "open" else "closed"
+        response = github_transport.request("PATCH", "issues", "/issues/%d" % record.new_issue_id, data=json.dumps({"state": github_state}))
+        if response.status_code == 200:
+            print("%s %d" % ("Reopened" if github_state == "open" else "Closed", record.new_issue_id))
+        else:
+            print("Could not change the state of %d to %s" % (record.new_issue_id, github_state))
+            print('Response:', response, response.content)
+            succeeded = False
+
+    return succeeded
+
+#lowercased names of every label the repo already has
+def list_github_labels():
+    names = set()
+    page = 1
+    while True:
+        response = github_transport.request("GET", "labels", "/labels?per_page=100&page=%d" % page)
+        if response.status_code != 200:
+            print("Could not list the labels of the repo")
+            print('Response:', response, response.content)
+            return None
+
+        labels = json.loads(response.content)
+        names.update(label['name'].lower() for label in labels)
+        if len(labels) < 100:
+            return names
+        page += 1
+
+#Every label in the catalog that the repo doesn't have yet is created before the first import, all at once, so the imports can refer to them
+#by name. The repo's labels are listed once for this rather than looked up per label.
+def create_github_labels():
+    existing = list_github_labels()
+    if existing is None:
+        return
+
+    missing = label_catalog.missing(existing)
+    print("Creating %d labels (%d already on GitHub)..." % (len(missing), len(label_catalog.labels) - len(missing)))
+
+    def create(entry):
+        response = github_transport.request("POST", "labels", "/labels", data=Label_Catalog.to_json(entry))
+        #someone else can have made it since the listing
+        if response.status_code != 201 and not (response.status_code == 422 and b"already_exists" in response.content):
+            print('Could not create label "%s"' % entry[0])
+            print('Response:', response, response.content)
+
+    with ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE) as pool:
+        list(pool.map(create, missing))
+
+#Points every link to an attachment in the export at a copy of it in ATTACHMENT_TARGET. Files are read out of the export one at a time
+#and hashed; bytes the store already has (from this run or an earlier one) are never stored again, the rest are stored in parallel.
+#Links to files the export doesn't have are left as they are.
+def rehost_attachments(records):
+    items = list(records) + [note for record in records for note in record.notes]
+    wanted = set()
+    finder = attachment_link_rewriter(wanted.add)
+    for item in items:
+        if "/uploads/" in item.text:
+            finder.rewrite(item.text)
+    if not wanted:
+        return
+
+    store = Attachment_Store(ATTACHMENT_TARGET, ATTACHMENT_BASE_URL, ATTACHMENT_CACHE_FILE)
+    print("Rehosting %d attachments to %s..." % (len(wanted), ATTACHMENT_TARGET))
+
+    urls = {} #path as linked -> URL
+    pending = {} #sha256 -> future of a file being stored
+    waiting = [] #(path as linked, future)
+    in_flight = deque()
+    already_hosted = 0
+    with ThreadPoolExecutor(max_workers=ATTACHMENT_WORKERS) as pool:
+        for path, f in export_upload_files(wanted):
+            data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+
+            url = store.url(digest)
+            if url is not None and digest not in pending:
+                urls[path] = url
+                already_hosted += 1
+                continue
+
+            if digest not in pending:
+                name = os.path.basename(urllib.parse.unquote(path)) or "attachment"
+                pending[digest] = pool.submit(store.store, digest, name, data)
+                in_flight.append(pending[digest])
+                #only a couple of files per worker are kept in memory waiting to be stored
+                if len(in_flight) > 2 * ATTACHMENT_WORKERS:
+                    in_flight.popleft().result()
+            waiting.append((path, pending[digest]))
+
+        for path, future in waiting:
+            urls[path] = future.result()
+
+    store.finish()
+
+    rewriter = attachment_link_rewriter(urls.get)
+    for item in items:
+        if "/uploads/" in item.text:
+            item.text = rewriter.rewrite(item.text)
+
+    print("%d attachments rehosted: %d files stored, %d duplicates, %d already hosted, %d not in the export\n" % (len(urls), store.stored,
+          len(waiting) - len(pending), already_hosted, len(wanted) - len(urls)))
+
+#Second pass once every issue and MR has its GitHub number: anything that was sent with a reference that couldn't be resolved at the time
+#is rendered again through the same serializer and, if that changed it, patched in place. Most bodies have no forward references so
+#this is usually a short list.
+def patch_github_references():
+    patched = 0
+    for patch in list(reference_index.patches.values()):
+        number = patch.record.new_issue_id
+        if number is None:
+            continue
+
+        #planned the same way as when it was sent, so the parts line up
+        if patch.imported:
+            current = json.loads(plan_import_payload(patch.record.to_import_json())[0])
+            body = current['issue']['body']
+        else:
+            current = json.loads(plan_body_payload(patch.record.to_json())[0])
+            body = current['body']
+
+        if patch.body is not None and body != patch.body:
+            response = github_transport.request("PATCH", "issues", "/issues/%d" % number, data=json.dumps({"body": body}))
+            if response.status_code == 200:
+                patched += 1
+            else:
+                print("Could not update references in %d" % number)
+                print('Response:', response, response.content)
+
+        comment_ids = None
+        for note, sent_body, comment_id, position in patch.comments:
+            if position is not None:
+                if position >= len(current['comments']):
+                    continue
+                body = current['comments'][position]['body']
+            else:
+                body = split_body(note.comment_body)[0]
+            if body == sent_body:
+                continue
+
+            if comment_id is None: #imported comments - find out what github numbered them
+                if comment_ids is None:
+                    comment_ids = list_github_issue_comment_ids(number) or []
+                if position >= len(comment_ids):
+                    continue
+                comment_id = comment_ids[position]
+
+            response = github_transport.request("PATCH", "issue_comments", "/issues/comments/%d" % comment_id, data=json.dumps({"body": body}))
+            if response.status_code == 200:
+                patched += 1
+            else:
+                print("Could not update references in a comment on %d" % number)
+                print('Response:', response, response.content)
+
+    print("Updated references in %d bodies and comments" % patched)
+
+
+#iids and failed_from pick the issues and MRs to import (see import_selection) - everything by default. They are read through the export
+#index, which needs uncompressed exports; otherwise iids is applied while streaming, along with record_filter (a Record_Filter).
+#With delta only what is new or changed since the last run is parsed and sent (see Delta_Sync and sync_github_changes). resend_unknown sends
+#again what an earlier run got no answer for (see Import_Journal.forget_unknown).
+def main(iids=None, failed_from=None, record_filter=None, delta=False, resend_unknown=False):
+    exports = [filename for filename in (PROJECT_FILE, ISSUES_FILE, MERGES_FILE) if filename is not None]
+    indexable = not any(filename.lower().endswith((".gz", ".zst", ".zstd") + archive_suffixes) for filename in exports)
+
+    if iids is not None and failed_from is None and not indexable:
+        record_filter = record_filter or Record_Filter()
+        record_filter.selected = import_selection(iids)
+        iids = None
+    sync = Delta_Sync(Import_Journal.read_sync(JOURNAL_FILE), delta, record_filter)
+
+    if failed_from is not None or iids is not None:
+        issue_list, mr_list, keys = parse_selected(import_selection(iids, failed_from), PROJECT_FILE, ISSUES_FILE, MERGES_FILE, sync)
+        reference_index.expect_keys(keys)
+    else:
+        #This gets us author names pulled from various actions since the creating author is not kept, along with all the issues and MRs
+        issue_list, mr_list = parse_export(PROJECT_FILE, ISSUES_FILE, MERGES_FILE, record_filter=sync)
 
     #sort them by their original IDs
     sorted_issue_list = sorted(issue_list, key=lambda x: int(x.orig_issue_id), reverse=False)
     sorted_mr_list = sorted(mr_list, key=lambda x: int(x.orig_mr_id), reverse=False)
+    reference_index.expect(sorted_issue_list + sorted_mr_list)
+
+    #closed and merged MRs go in after the issues through the same import, so they number after them and before the open pull requests
+    closed_mr_list = []
+    if IMPORT_CLOSED_MRS_AS_ISSUES:
+        closed_mr_list = [mr for mr in sorted_mr_list if mr.state != "open"]
 
     #Simple safety check to prevent someone from doing something without knowing what they were doing
     response = input('This will, without further confirmation and irreversibly, import all loaded issues, merge requests, and comments to the specified GitHub repo (%s/%s). To continue: type "proceed"\n'%(GH_OWNER,GH_REPO))
 
     if response == "proceed":
-        print("Sending to GitHub...")
-
-        print("Sending Issues...")
-        for issue in sorted_issue_list:
-            create_github_issue(issue)
-            sleep(5) #allow github to process to avoid out of order issues and rate-abuse-monitoring
-
-        print("Sending Pull Requests...")
-        for mr in sorted_mr_list:
-            if mr.state is "open":
-                create_github_pull_request(mr)
-                sleep(3)  #allow github to process to avoid out of order issues and rate-abuse-monitoring
+        import_journal.open(JOURNAL_FILE)
+        if resend_unknown:
+            import_journal.forget_unknown()
+
+        #anything already sent by an earlier run is skipped so resuming doesn't create duplicates
+        import_list = sorted_issue_list + closed_mr_list
+        remaining_import_list = [record for record in import_list if not import_journal.done(*record.key) and not import_journal.unresolved(*record.key)]
+        for record in sorted_issue_list + sorted_mr_list:
+            record.new_issue_id = import_journal.github_number(*record.key)
+        #issues and MRs an earlier run didn't get all the follow-up comments of up
+        incomplete = [record for record in sorted_issue_list + sorted_mr_list if import_journal.follow_ups_missing(*record.key)]
+
+        #everything imported before, which when only some records were selected is more than what's in the lists
+        for (kind, key), entry in list(import_journal.entries.items()):
+            if kind in reference_index.numbers and entry[1] is not None:
+                reference_index.add(kind, key, entry[1])
+
+        try:
+            if ATTACHMENT_TARGET is not None:
+                rehost_attachments(sorted_issue_list + sorted_mr_list)
+
+            print("Sending to GitHub...")
+
+            if IMPORT_LABELS and label_catalog.labels:
+                create_github_labels()
+
+            print("Sending Issues and %d closed/merged MRs... (%d already sent)" % (len(closed_mr_list), len(import_list) - len(remaining_import_list)))
+            asyncio.run(import_github_issues(remaining_import_list))
+
+            failures = import_tracker.failures()
+            if failures:
+                print("%d Issues failed to import:" % len(failures))
+                for status in failures:
+                    print('\t"%s": %s' % (status.issue.title, status.errors))
+
+            if import_tracker.out_of_order:
+                print("%d Issues were imported out of order:" % len(import_tracker.out_of_order))
+                for issue, previous in import_tracker.out_of_order:
+                    print('\t"%s" (%s %s) is #%d, before "%s" (%s %s) at #%d' % ((issue.title,) + issue.key + (issue.new_issue_id, previous.title)
+                          + previous.key + (previous.new_issue_id,)))
+
+            print("Sending Pull Requests...")
+            for mr in sorted_mr_list:
+                if mr.state == "open" and mr.new_issue_id is None and not import_journal.unresolved(*mr.key):
+                    create_github_pull_request(mr)
         
-        print("Posting comments to valid pull requests...")
-        for mr in sorted_mr_list:
-            if mr.state is "open":
-                if mr.new_issue_id is not None:
-                    add_github_pull_request_comments(mr)
-                    sleep(3)  #allow github to process to avoid out of order issues and rate-abuse-monitoring
-
+            unsynced = set() #keys of records that didn't make it to GitHub in full, so the next delta run looks at them again
+            print("Posting comments to valid pull requests...")
+            for mr in sorted_mr_list:
+                if mr.state == "open":
+                    if mr.new_issue_id is not None:
+                        if not add_github_pull_request_comments(mr):
+                            unsynced.add(mr.key)
+
+            if incomplete:
+                print("Posting the comments earlier runs left missing on %d Issues and MRs..." % len(incomplete))
+                for record in incomplete:
+                    if record.new_issue_id is not None:
+                        post_missing_follow_up_comments(record)
+
+            if sync.changed:
+                print("Syncing %d changed Issues and MRs..." % len(sync.changed))
+                for record in sorted_issue_list + sorted_mr_list:
+                    if record.key not in sync.changed:
+                        continue
+                    if record.new_issue_id is None: #e.g. its import is still unresolved - its changes wait for a run that knows its number
+                        print("Can't sync %s %s, it has no GitHub number" % record.key)
+                        unsynced.add(record.key)
+                    elif not sync_github_changes(record, sync.synced[record.key], sync.current[record.key][2]):
+                        unsynced.add(record.key)
+
+            if reference_index.patches:
+                print("Updating references that were sent before their GitHub number was known...")
+                patch_github_references()
+
+            missing = [record for record in sorted_issue_list + sorted_mr_list if import_journal.follow_ups_missing(*record.key)]
+            if missing:
+                print("%d Issues and MRs are still missing comments they were too big for, the next run posts them: %s" % (len(missing),
+                      ", ".join("%s %s" % record.key for record in missing)))
+                unsynced.update(record.key for record in missing)
+
+            for record in sorted_issue_list + sorted_mr_list:
+                if import_journal.done(*record.key) and record.key in sync.current and record.key not in unsynced:
+                    import_journal.record_sync(*record.key, *sync.current[record.key])
+        finally:
+            import_journal.close() #make sure the last batch of entries makes it to disk, even on a crash
+            if REWRITE_REFERENCES:
+                reference_index.save(REFERENCE_INDEX_FILE)
 
     else:
         print('Response: "proceed" not found. Cancelling...')
+
+    github_transport.stats.report(github_transport.breaker)
+    github_transport.tokens.report()
+    github_transport.close()
     
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Import a GitLab project export to GitHub")
+    parser.add_argument("--iids", default=None, help='only import the issues and MRs with these iids, e.g. "120-180,200" (prefix # for issues only, ! for MRs only)')
+    parser.add_argument("--failed-from", default=None, metavar="JOURNAL", help="only import what failed to import according to this journal")
+    parser.add_argument("--state", action="append", help="only import issues and MRs in this GitLab state (opened, closed, merged, locked), can be repeated")
+    parser.add_argument("--created-after", help="only import what was created on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--created-before", help="only import what was created before this date")
+    parser.add_argument("--updated-after", help="only import what was last updated on or after this date")
+    parser.add_argument("--updated-before", help="only import what was last updated before this date")
+    parser.add_argument("--author", action="append", help="only import what this user (full name, username or id) opened, can be repeated")
+    parser.add_argument("--label", action="append", help="only import what has this label, can be repeated")
+    parser.add_argument("--delta", action="store_true", help="only send what is new or changed since the last run: new issues and MRs, new notes and state changes")
+    parser.add_argument("--resend-unknown", action="store_true", help="send again what got no answer from GitHub in an earlier run - check that it isn't there first")
+    args = parser.parse_args()
+
+    record_filter = None
+    if args.state or args.created_after or args.created_before or args.updated_after or args.updated_before or args.author or args.label:
+        record_filter = Record_Filter(args.state, args.created_after, args.created_before, args.updated_after, args.updated_before, args.author, args.label)
+    main(args.iids, args.failed_from, record_filter, args.delta, args.resend_unknown)
 
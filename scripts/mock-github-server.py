@@ -0,0 +1,477 @@
+import argparse
+import json
+import random
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+from datetime import datetime, timezone
+
+#Local stand-in for the parts of the GitHub API the importers use, so they can be run and measured without touching real GitHub:
+#   POST /repos/{owner}/{repo}/import/issues            -> 202, processed in the background
+#   GET  /repos/{owner}/{repo}/import/issues/{id}       -> status of one import
+#   GET  /repos/{owner}/{repo}/import/issues?since=...  -> status of every import since then (ETag / If-None-Match aware)
+#   POST /repos/{owner}/{repo}/pulls                    -> 201 with the new number
+#   GET  /repos/{owner}/{repo}/issues/{n}               -> an issue or pull request
+#   POST /repos/{owner}/{repo}/issues/{n}/comments      -> 201
+#   GET  /repos/{owner}/{repo}/issues/{n}/comments      -> comments in the order they were created (per_page / page aware)
+#   PATCH /repos/{owner}/{repo}/issues/{n}              -> 200, edits the body of an issue or pull request
+#   PATCH /repos/{owner}/{repo}/issues/comments/{id}    -> 200, edits a comment
+#   GET  /repos/{owner}/{repo}/labels                   -> labels in the order they were created (per_page / page aware)
+#   POST /repos/{owner}/{repo}/labels                   -> 201, or 422 already_exists
+#   POST /repos/{owner}/{repo}/issues/{n}/labels        -> 200, adds labels to an issue or pull request
+#Issues and pull requests share one numbering sequence like they do on GitHub, and bodies over 65536 characters are refused like they are there.
+#
+#To use: python3 mock-github-server.py --port 8000, then point GH_API_URL in joint-importer.py at http://127.0.0.1:8000
+
+body_limit = 65536
+
+import_path = re.compile(r'^/repos/[^/]+/[^/]+/import/issues(?:/(\d+))?$')
+pulls_path = re.compile(r'^/repos/[^/]+/[^/]+/pulls$')
+comments_path = re.compile(r'^/repos/[^/]+/[^/]+/issues/(\d+)/comments$')
+issue_path = re.compile(r'^/repos/[^/]+/[^/]+/issues/(\d+)$')
+comment_path = re.compile(r'^/repos/[^/]+/[^/]+/issues/comments/(\d+)$')
+labels_path = re.compile(r'^/repos/[^/]+/[^/]+/labels$')
+issue_labels_path = re.compile(r'^/repos/[^/]+/[^/]+/issues/(\d+)/labels$')
+
+
+def timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def too_long(payload):
+    return len(payload.get('body') or "") > body_limit
+
+
+#Everything the fake repository knows, shared by all the request handler threads
+class Mock_GitHub:
+    def __init__(self, latency=0.0, jitter=0.0, process_delay=0.05, reorder=0, quota=5000, quota_window=3600,
+                 secondary_per_second=0, retry_after=1, error_rate=0.0, seed=None):
+        self.latency = latency #seconds added to every response
+        self.jitter = jitter #random extra seconds on top of latency
+        self.process_delay = process_delay #seconds the background worker takes to process one issue import
+        self.reorder = reorder #if > 0, imports are picked at random from the oldest `reorder` pending ones instead of in order
+        self.quota = quota #primary rate limit per window, for each access token
+        self.quota_window = quota_window
+        self.secondary_per_second = secondary_per_second #if > 0, more requests than this in one second get a secondary limit 403
+        self.retry_after = retry_after #Retry-After sent with secondary limit responses
+        self.error_rate = error_rate #fraction of requests answered with a random 5xx
+        self.random = random.Random(seed)
+
+        self.lock = threading.Condition()
+        self.next_number = 1
+        self.imports = [] #status dicts, index = id - 1
+        self.queue = [] #import ids waiting to be processed
+        self.issues = {} #number -> issue or pull request payload
+        self.comments = {} #number -> list of comment payloads, each given an "id"
+        self.comments_by_id = {} #comment id -> comment payload
+        self.labels = {} #lowercased name -> label payload
+
+        self.quotas = {} #Authorization header -> [remaining, reset time]
+        self.second = 0
+        self.second_count = 0
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors_injected = 0
+
+        self.base_url = None
+        self.repo_name = None
+        self.running = True
+        self.worker = threading.Thread(target=self.process_imports, daemon=True)
+        self.worker.start()
+
+    def process_imports(self):
+        while True:
+            with self.lock:
+                while self.running and not self.queue:
+                    self.lock.wait()
+                if not self.running:
+                    return
+
+            sleep(self.process_delay)
+
+            with self.lock:
+                if self.reorder > 0:
+                    index = self.random.randrange(min(self.reorder, len(self.queue)))
+                else:
+                    index = 0
+                status = self.imports[self.queue.pop(index) - 1]
+
+                payload = status.pop('payload')
+                issue = payload.get('issue') or {}
+                if not issue.get('title') or 'body' not in issue:
+                    status['status'] = "failed"
+                    status['errors'] = [{"location": "/issue", "resource": "Issue", "field": "title", "code": "missing_field"}]
+                elif too_long(issue) or any(too_long(comment) for comment in payload.get('comments', [])):
+                    status['status'] = "failed"
+                    status['errors'] = [{"location": "/issue", "resource": "Issue", "field": "body", "code": "too_long"}]
+                else:
+                    number = self.next_number
+                    self.next_number += 1
+                    self.issues[number] = issue
+                    self.comments[number] = []
+                    for comment in payload.get('comments', []):
+                        self.add_comment(number, comment)
+                    status['status'] = "imported"
+                    status['issue_url'] = "%s/issues/%d" % (status['url'].split("/import/")[0], number)
+                status['updated_at'] = timestamp(time())
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+
+    #[remaining, reset time] of the primary rate limit for one token, callers hold the lock
+    def quota_for(self, token):
+        now = time()
+        quota = self.quotas.get(token)
+        if quota is None or now >= quota[1]:
+            quota = self.quotas[token] = [self.quota, now + self.quota_window]
+        return quota
+
+    #primary and secondary rate limits - returns (status code, message, extra headers) if this request is refused
+    def check_limits(self, token):
+        now = time()
+        quota = self.quota_for(token)
+        if quota[0] <= 0:
+            return 403, "API rate limit exceeded", {}
+
+        second = int(now)
+        if second != self.second:
+            self.second = second
+            self.second_count = 0
+        self.second_count += 1
+        if self.secondary_per_second > 0 and self.second_count > self.secondary_per_second:
+            return 403, "You have exceeded a secondary rate limit. Please wait a few minutes before you try again.", {"Retry-After": str(self.retry_after)}
+
+        quota[0] -= 1
+        return None
+
+    def rate_headers(self, token):
+        remaining, reset_at = self.quota_for(token)
+        return {
+            "X-RateLimit-Limit": str(self.quota),
+            "X-RateLimit-Remaining": str(max(remaining, 0)),
+            "X-RateLimit-Reset": str(int(reset_at)),
+        }
+
+    def create_import(self, payload):
+        with self.lock:
+            import_id = len(self.imports) + 1
+            now = timestamp(time())
+            status = {
+                "id": import_id,
+                "status": "pending",
+                "url": "%s/repos/%s/import/issues/%d" % (self.base_url, self.repo_name, import_id),
+                "import_issues_url": "%s/repos/%s/import/issues" % (self.base_url, self.repo_name),
+                "repository_url": "%s/repos/%s" % (self.base_url, self.repo_name),
+                "created_at": now,
+                "updated_at": now,
+                "payload": payload,
+            }
+            self.imports.append(status)
+            self.queue.append(import_id)
+            self.lock.notify_all()
+            return self.public_status(status)
+
+    @staticmethod
+    def public_status(status):
+        return dict((key, value) for key, value in status.items() if key != 'payload')
+
+    def import_status(self, import_id):
+        with self.lock:
+            if import_id < 1 or import_id > len(self.imports):
+                return None
+            return self.public_status(self.imports[import_id - 1])
+
+    def import_statuses(self, since):
+        with self.lock:
+            return [self.public_status(status) for status in self.imports if since is None or status['created_at'] >= since]
+
+    def create_pull(self, payload):
+        with self.lock:
+            number = self.next_number
+            self.next_number += 1
+            self.issues[number] = payload
+            self.comments[number] = []
+            return {"number": number, "title": payload.get('title')}
+
+    #callers hold the lock
+    def add_comment(self, number, payload):
+        comment = dict(payload, id=len(self.comments_by_id) + 1)
+        self.comments[number].append(comment)
+        self.comments_by_id[comment['id']] = comment
+        return comment
+
+    def create_comment(self, number, payload):
+        with self.lock:
+            if number not in self.comments:
+                return None
+            comment = self.add_comment(number, payload)
+            return {"id": comment['id'], "body": comment.get('body')}
+
+    def list_comments(self, number, per_page, page):
+        with self.lock:
+            if number not in self.comments:
+                return None
+            start = (page - 1) * per_page
+            return [dict(comment) for comment in self.comments[number][start:start + per_page]]
+
+    def list_labels(self, per_page, page):
+        with self.lock:
+            start = (page - 1) * per_page
+            return [dict(label) for label in list(self.labels.values())[start:start + per_page]]
+
+    #None if there is one by that name already
+    def create_label(self, payload):
+        with self.lock:
+            name = str(payload.get('name'))
+            if name.lower() in self.labels:
+                return None
+            label = self.labels[name.lower()] = {"name": name, "color": payload.get('color', "ededed"), "description": payload.get('description')}
+            return dict(label)
+
+    def add_issue_labels(self, number, names):
+        with self.lock:
+            issue = self.issues.get(number)
+            if issue is None:
+                return None
+            labels = issue.setdefault('labels', [])
+            labels.extend(name for name in names if name not in labels)
+            return [{"name": name} for name in labels]
+
+    def get_issue(self, number):
+        with self.lock:
+            issue = self.issues.get(number)
+            if issue is None:
+                return None
+            return dict(issue, number=number)
+
+    def edit_issue(self, number, payload):
+        with self.lock:
+            issue = self.issues.get(number)
+            if issue is None:
+                return None
+            issue.update(payload)
+            return dict(issue, number=number)
+
+    def edit_comment(self, comment_id, payload):
+        with self.lock:
+            comment = self.comments_by_id.get(comment_id)
+            if comment is None:
+                return None
+            comment.update(payload)
+            return dict(comment)
+
+
+def make_handler(github):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" #keep-alive, like the real API
+        disable_nagle_algorithm = True #otherwise small responses sit waiting on delayed ACKs
+
+        def reply(self, code, body=None, headers=None):
+            content = b"" if body is None else json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            with github.lock:
+                rate_headers = github.rate_headers(self.headers.get("Authorization"))
+            for key, value in rate_headers.items():
+                self.send_header(key, value)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def read_payload(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                return json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return None
+
+        #latency, rate limits and injected errors every request goes through - returns True if the request was already answered
+        def preamble(self):
+            with github.lock:
+                github.requests += 1
+                refused = github.check_limits(self.headers.get("Authorization"))
+                inject_error = github.error_rate > 0 and github.random.random() < github.error_rate
+                delay = github.latency + github.jitter * github.random.random()
+                if refused is not None:
+                    github.rate_limited += 1
+                elif inject_error:
+                    github.errors_injected += 1
+
+            if delay > 0:
+                sleep(delay)
+
+            if refused is not None:
+                code, message, headers = refused
+                self.reply(code, {"message": message}, headers)
+                return True
+            if inject_error:
+                self.reply(github.random.choice((500, 502, 503)), {"message": "Server Error"})
+                return True
+            return False
+
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            if self.preamble():
+                return
+            arguments = dict(pair.partition("=")[::2] for pair in query.split("&") if pair)
+
+            match = comments_path.match(path)
+            if match is not None:
+                comments = github.list_comments(int(match.group(1)), int(arguments.get("per_page", 30)), int(arguments.get("page", 1)))
+                if comments is None:
+                    self.reply(404, {"message": "Not Found"})
+                else:
+                    self.reply(200, comments)
+                return
+
+            if labels_path.match(path):
+                self.reply(200, github.list_labels(int(arguments.get("per_page", 30)), int(arguments.get("page", 1))))
+                return
+
+            match = issue_path.match(path)
+            if match is not None:
+                issue = github.get_issue(int(match.group(1)))
+                if issue is None:
+                    self.reply(404, {"message": "Not Found"})
+                else:
+                    self.reply(200, issue)
+                return
+
+            match = import_path.match(path)
+            if match is None:
+                self.reply(404, {"message": "Not Found"})
+            elif match.group(1) is not None:
+                status = github.import_status(int(match.group(1)))
+                if status is None:
+                    self.reply(404, {"message": "Not Found"})
+                else:
+                    self.reply(200, status)
+            else:
+                since = arguments.get("since")
+                statuses = github.import_statuses(since)
+                etag = '"%x"' % (hash(json.dumps(statuses, sort_keys=True)) & 0xffffffffffff)
+                if self.headers.get("If-None-Match") == etag:
+                    self.reply(304, None, {"ETag": etag})
+                else:
+                    self.reply(200, statuses, {"ETag": etag})
+
+        def do_POST(self):
+            payload = self.read_payload()
+            if self.preamble():
+                return
+            if payload is None:
+                self.reply(400, {"message": "Problems parsing JSON"})
+                return
+            if not import_path.match(self.path) and too_long(payload):
+                self.reply(422, {"message": "Validation Failed", "errors": [{"field": "body", "code": "custom", "message": "body is too long (maximum is %d characters)" % body_limit}]})
+                return
+
+            if import_path.match(self.path):
+                self.reply(202, github.create_import(payload))
+            elif pulls_path.match(self.path):
+                self.reply(201, github.create_pull(payload))
+            elif labels_path.match(self.path):
+                label = github.create_label(payload)
+                if label is None:
+                    self.reply(422, {"message": "Validation Failed", "errors": [{"resource": "Label", "code": "already_exists", "field": "name"}]})
+                else:
+                    self.reply(201, label)
+            elif issue_labels_path.match(self.path):
+                labels = github.add_issue_labels(int(issue_labels_path.match(self.path).group(1)), payload.get('labels') or [])
+                if labels is None:
+                    self.reply(404, {"message": "Not Found"})
+                else:
+                    self.reply(200, labels)
+            else:
+                match = comments_path.match(self.path)
+                comment = None
+                if match is not None:
+                    comment = github.create_comment(int(match.group(1)), payload)
+                if comment is None:
+                    self.reply(404, {"message": "Not Found"})
+                else:
+                    self.reply(201, comment)
+
+        def do_PATCH(self):
+            payload = self.read_payload()
+            if self.preamble():
+                return
+            if payload is None:
+                self.reply(400, {"message": "Problems parsing JSON"})
+                return
+
+            result = None
+            match = issue_path.match(self.path)
+            if match is not None:
+                result = github.edit_issue(int(match.group(1)), payload)
+            match = comment_path.match(self.path)
+            if match is not None:
+                result = github.edit_comment(int(match.group(1)), payload)
+
+            if result is None:
+                self.reply(404, {"message": "Not Found"})
+            else:
+                self.reply(200, result)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+#start the server on a background thread - returns (server, Mock_GitHub state); port 0 picks a free port
+def start_mock_server(host="127.0.0.1", port=0, owner="codes-org", repo="test-codes", **options):
+    github = Mock_GitHub(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(github))
+    server.daemon_threads = True
+    github.base_url = "http://%s:%d" % server.server_address
+    github.repo_name = "%s/%s" % (owner, repo)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, github
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the GitHub endpoints used by the importers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--owner", default="codes-org")
+    parser.add_argument("--repo", default="test-codes")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds on top of --latency")
+    parser.add_argument("--process-delay", type=float, default=0.05, help="seconds to process one issue import")
+    parser.add_argument("--reorder", type=int, default=0, help="process imports out of order from the oldest N pending")
+    parser.add_argument("--quota", type=int, default=5000, help="primary rate limit per window")
+    parser.add_argument("--quota-window", type=int, default=3600, help="seconds until the primary rate limit resets")
+    parser.add_argument("--secondary-per-second", type=int, default=0, help="secondary rate limit, 0 to disable")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After sent with secondary limit responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 5xx")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server, github = start_mock_server(args.host, args.port, args.owner, args.repo,
+                                       latency=args.latency, jitter=args.jitter, process_delay=args.process_delay,
+                                       reorder=args.reorder, quota=args.quota, quota_window=args.quota_window,
+                                       secondary_per_second=args.secondary_per_second, retry_after=args.retry_after,
+                                       error_rate=args.error_rate, seed=args.seed)
+
+    print("Mock GitHub listening on %s (repo %s)" % (github.base_url, github.repo_name))
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        print("\nServed %d requests (%d rate limited, %d injected errors), created %d issues/pull requests"
+              % (github.requests, github.rate_limited, github.errors_injected, len(github.issues)))
+        github.stop()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
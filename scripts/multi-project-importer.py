@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import threading
+import traceback
+from time import monotonic
+
+from script_loader import load_script
+
+#Runs joint-importer.py for many GitLab projects at once, in one process. Every project gets its own copy of the importer (its own
+#repository, journal, reference index and author names), but they all send through one GitHub_Transport, so the connection pool,
+#the tokens and their quota, the rate limit and the circuit breaker are shared. The rate budget is handed out fairly: the next request
+#to go out is always from the project that has sent the fewest while it was waiting, so a big project can't starve the small ones.
+#Each project's own output goes to <state dir>/<name>.log; this prints a progress and ETA line per project every --report-interval.
+#
+#The manifest is a JSON list with one object per project:
+#   {"name": "codes", "project": "export/codes/project.json", "owner": "codes-org", "repo": "codes",
+#    "gitlab_url": "https://xgitlab.cels.anl.gov/codes/codes"}
+#with optional "issues" and "merges" files (like ISSUES_FILE and MERGES_FILE), and "uploads", "attachment_target" and "attachment_base_url"
+#(like UPLOADS_DIR, ATTACHMENT_TARGET and ATTACHMENT_BASE_URL). Relative paths are relative to the manifest.
+#
+#To use: python3 multi-project-importer.py manifest.json [--state-dir migration] [--max-projects 4]
+
+
+#Hands out the shared rate budget one request at a time, to the waiting project that has been given the fewest so far.
+#A project that comes back after sitting idle is caught up to the others, it doesn't get to make up for the time it didn't use.
+class Fair_Share:
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.waiting = {} #project -> requests waiting for their turn
+        self.granted = {} #project -> requests let through
+        self.busy = False #someone is waiting on the limiter
+        self.lock = threading.Condition()
+
+    def next_project(self):
+        return min((project for project, count in self.waiting.items() if count), key=lambda project: self.granted[project])
+
+    def acquire(self, project):
+        with self.lock:
+            if not self.waiting.get(project):
+                others = [self.granted[other] for other, count in self.waiting.items() if count]
+                self.granted[project] = max(self.granted.get(project, 0), min(others) if others else 0)
+            self.waiting[project] = self.waiting.get(project, 0) + 1
+            while self.busy or self.next_project() != project:
+                self.lock.wait()
+            self.busy = True
+
+        try:
+            self.limiter.acquire()
+        finally:
+            with self.lock:
+                self.busy = False
+                self.waiting[project] -= 1
+                self.granted[project] += 1
+                self.lock.notify_all()
+
+    def update(self, response):
+        return self.limiter.update(response)
+
+    def lane(self, project):
+        return Fair_Share_Lane(self, project)
+
+
+#what a project's transport sees as its rate limiter
+class Fair_Share_Lane:
+    def __init__(self, share, project):
+        self.share = share
+        self.project = project
+
+    def acquire(self):
+        self.share.acquire(self.project)
+
+    def update(self, response):
+        return self.share.update(response)
+
+
+class Project:
+    def __init__(self, entry, base_dir, state_dir):
+        def path(name):
+            if entry.get(name) is None:
+                return None
+            return os.path.join(base_dir, entry[name])
+
+        self.name = entry["name"]
+        self.owner = entry["owner"]
+        self.repo = entry["repo"]
+        self.gitlab_url = entry["gitlab_url"].rstrip("/")
+        self.project_file = path("project")
+        self.issues_file = path("issues")
+        self.merges_file = path("merges")
+        self.uploads_dir = path("uploads")
+        self.attachment_target = entry.get("attachment_target")
+        if self.attachment_target is not None and not self.attachment_target.startswith("git:"):
+            self.attachment_target = path("attachment_target")
+        self.attachment_base_url = entry.get("attachment_base_url")
+        self.journal_file = os.path.join(state_dir, "%s-import-journal.sqlite3" % self.name)
+        self.reference_index_file = os.path.join(state_dir, "%s-reference-index.json" % self.name)
+        self.attachment_cache_file = os.path.join(state_dir, "%s-attachment-cache.json" % self.name)
+        self.log_file = os.path.join(state_dir, "%s.log" % self.name)
+
+        self.importer = None
+        self.state = "waiting" #waiting, parsing, sending, done or failed
+        self.error = None
+        self.started = None #when sending started
+        self.already_done = 0 #items finished by earlier runs
+
+    #point a fresh copy of the importer at this project, sending through a view of transport
+    def load(self, module_name, transport, limiter, log):
+        importer = load_script("joint-importer.py", module_name, quiet=True) #a separate copy with its own globals
+        transport = transport.for_repo(self.owner, self.repo, limiter=limiter, stats=importer.Transport_Stats()) #its stats report goes to the log
+        importer.PROJECT_FILE = self.project_file
+        importer.ISSUES_FILE = self.issues_file
+        importer.MERGES_FILE = self.merges_file
+        importer.JOURNAL_FILE = self.journal_file
+        importer.REFERENCE_INDEX_FILE = self.reference_index_file
+        importer.UPLOADS_DIR = self.uploads_dir
+        importer.ATTACHMENT_TARGET = self.attachment_target
+        importer.ATTACHMENT_BASE_URL = self.attachment_base_url
+        importer.ATTACHMENT_CACHE_FILE = self.attachment_cache_file
+        importer.GH_OWNER = self.owner
+        importer.GH_REPO = self.repo
+        importer.project_base_url = self.gitlab_url
+        importer.issues_base_url = self.gitlab_url + "/issues/"
+        importer.mr_base_url = self.gitlab_url + "/merge_requests/"
+        importer.github_transport = transport
+        importer.print = lambda *args, **kwargs: print(*args, file=log, flush=True, **kwargs)
+        importer.input = self.confirmed
+
+        journal_open = importer.import_journal.open
+
+        def open_journal(filename):
+            journal_open(filename)
+            self.already_done = self.finished()
+            self.started = monotonic()
+
+        importer.import_journal.open = open_journal
+        self.importer = importer
+
+    #everything was confirmed for all projects up front
+    def confirmed(self, prompt):
+        self.state = "sending"
+        return "proceed"
+
+    def total(self):
+        if self.importer is None:
+            return 0
+        numbers = self.importer.reference_index.numbers
+        return len(numbers["issue"]) + len(numbers["mr"])
+
+    #issues and merge requests that are done with, one way or the other
+    def finished(self):
+        if self.importer is None:
+            return 0
+        finished_states = ("imported", "created", "failed")
+        return sum(1 for (kind, key), entry in list(self.importer.import_journal.entries.items())
+                   if kind in ("issue", "mr") and entry[0] in finished_states)
+
+    def progress(self):
+        total = self.total()
+        finished = self.finished()
+        line = "%-24s %-8s %7d/%-7d" % (self.name, self.state, finished, total)
+        if total:
+            line += " %5.1f%%" % (100.0 * finished / total)
+        if self.state == "failed":
+            return line + "  " + self.error
+
+        if self.state == "sending" and self.started is not None:
+            elapsed = monotonic() - self.started
+            rate = (finished - self.already_done) / elapsed if elapsed > 0 else 0.0
+            line += " %7.2f items/s" % rate
+            if rate > 0:
+                line += "  ETA %s" % format_duration((total - finished) / rate)
+        return line
+
+    def run(self):
+        self.state = "parsing"
+        try:
+            self.importer.main()
+            self.state = "done"
+        except Exception as error:
+            self.state = "failed"
+            self.error = "%s: %s" % (type(error).__name__, error)
+            self.importer.print(traceback.format_exc())
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def load_manifest(filename, state_dir):
+    with open(filename) as f:
+        entries = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(filename))
+    projects = [Project(entry, base_dir, state_dir) for entry in entries]
+    names = [project.name for project in projects]
+    if len(set(names)) != len(names):
+        raise ValueError("Project names in %s have to be unique, they name the journal and log files" % filename)
+    return projects
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import many GitLab project exports to GitHub at once, sharing one rate budget")
+    parser.add_argument("manifest", help="JSON list of {name, project, owner, repo, gitlab_url} objects")
+    parser.add_argument("--state-dir", default="migration", help="where each project's journal, reference index and log are kept")
+    parser.add_argument("--max-projects", type=int, default=0, help="projects imported at the same time (default: all of them)")
+    parser.add_argument("--report-interval", type=float, default=30.0, help="seconds between progress reports")
+    parser.add_argument("--max-rate", type=float, default=None, help="requests/sec shared by all projects (default: RATE_LIMIT_MAX_PER_SECOND per token)")
+    parser.add_argument("--api-url", default=None, help="GitHub API to send to (default: GH_API_URL), e.g. a mock-github-server.py for a dry run")
+    args = parser.parse_args()
+
+    os.makedirs(args.state_dir, exist_ok=True)
+    projects = load_manifest(args.manifest, args.state_dir)
+
+    base = load_script("joint-importer.py", "joint_importer", quiet=True)
+    limiter = base.rate_limiter
+    if args.max_rate is not None:
+        limiter = base.Rate_Limiter(max_rate=args.max_rate)
+    transport = base.GitHub_Transport(base.GH_TOKENS, api_url=args.api_url or base.GH_API_URL, limiter=limiter)
+    share = Fair_Share(transport.limiter)
+
+    print("Projects to import:")
+    for project in projects:
+        print("\t%s -> %s/%s" % (project.project_file or project.issues_file, project.owner, project.repo))
+    response = input('This will, without further confirmation and irreversibly, import all of these projects to their GitHub repos. To continue: type "proceed"\n')
+    if response != "proceed":
+        print('Response: "proceed" not found. Cancelling...')
+        return
+
+    logs = []
+    for number, project in enumerate(projects):
+        log = open(project.log_file, "a")
+        logs.append(log)
+        project.load("joint_importer_%d" % number, transport, share.lane(project.name), log)
+
+    slots = threading.Semaphore(args.max_projects or len(projects))
+
+    def run(project):
+        with slots:
+            project.run()
+
+    threads = [threading.Thread(target=run, args=(project,), name=project.name) for project in projects]
+    start = monotonic()
+    for thread in threads:
+        thread.start()
+
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(args.report_interval / len(threads))
+            print("\n%s elapsed" % format_duration(monotonic() - start))
+            for project in projects:
+                print(project.progress())
+    finally:
+        for log in logs:
+            log.close()
+
+    failed = [project for project in projects if project.state == "failed"]
+    print("\n%d of %d projects imported in %s" % (len(projects) - len(failed), len(projects), format_duration(monotonic() - start)))
+    for project in failed:
+        print('\t"%s" failed, see %s: %s' % (project.name, project.log_file, project.error))
+    if transport.breaker.trips:
+        print("Sending was paused %d times by the circuit breaker" % transport.breaker.trips)
+    transport.tokens.report()
+    transport.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import contextlib
+import gc
+import io
+import os
+import tracemalloc
+from time import perf_counter
+
+from script_loader import load_script
+
+#Times and memory-profiles each parse phase of joint-importer.py (author discovery, issue parsing, MR parsing) separately
+#on synthetic exports from export-generator.py, so scaling regressions show up as numbers.
+#Each phase runs twice: once plain for the timing, and once under tracemalloc for its peak and retained memory.
+#
+#To use: python3 parse-benchmark.py --sizes 1000,10000,100000 [--data-dir /tmp/exports]
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def export_for_size(generator_module, data_dir, size, seed):
+    filename = os.path.join(data_dir, "synthetic-%d-seed%d.json" % (size, seed))
+    if not os.path.exists(filename):
+        print("Generating %s..." % filename)
+        generator = generator_module.Export_Generator(seed=seed)
+        with open(filename + ".partial", "w") as f:
+            generator.write(f, size, size // 5)
+        os.rename(filename + ".partial", filename)
+    return filename
+
+
+#each phase returns how many records it handled and whatever it produced, which is kept alive until the memory is measured
+def parse_phases(importer, filename, workers):
+    def authors():
+        importer.author_id_map.clear()
+        importer.secondary_author_id_map.clear()
+        scanned = [0]
+
+        def counted(records):
+            for record in records:
+                scanned[0] += 1
+                yield record
+
+        importer.find_author_id_pairs(counted(importer.load_project_file(filename)))
+        return scanned[0], None
+
+    def issues():
+        issue_list = importer.process_issues(importer.load_data_file(filename, "issues"))
+        return len(issue_list), issue_list
+
+    def merge_requests():
+        mr_list = importer.process_merge_requests(importer.load_data_file(filename, "merge_requests"))
+        return len(mr_list), mr_list
+
+    #the single pass main() does, with and without the author index cached from the previous run
+    def fused(use_cache, workers=0):
+        def parse():
+            importer.author_id_map.clear()
+            importer.secondary_author_id_map.clear()
+            if not use_cache and os.path.exists(filename + importer.AUTHOR_CACHE_SUFFIX):
+                os.remove(filename + importer.AUTHOR_CACHE_SUFFIX)
+            issue_list, mr_list = importer.parse_export(filename, workers=workers)
+            return len(issue_list) + len(mr_list), (issue_list, mr_list)
+        return parse
+
+    return [("find_author_id_pairs", authors), ("process_issues", issues), ("process_merge_requests", merge_requests),
+            ("parse_export", fused(False)), ("parse_export (cached)", fused(True)),
+            ("parse_export (%d workers)" % workers, fused(True, workers))]
+
+
+def run_phase(phase, memory):
+    gc.collect()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if memory:
+            tracemalloc.start()
+            count, result = phase()
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return count, retained, peak
+        start = perf_counter()
+        count, result = phase()
+        return count, perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the parse phases of joint-importer.py on synthetic exports")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated issue counts (MRs are a fifth of that)")
+    parser.add_argument("--data-dir", default=os.path.join(script_dir, "..", "export", "synthetic"), help="where generated exports are cached")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="timing runs per phase, the best is reported")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--workers", type=int, default=4, help="parse workers for the process pool phase (its memory is this process only)")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    os.environ.setdefault("GH_TOKEN", "benchmark")
+    importer = load_script("joint-importer.py", "joint_importer", quiet=True)
+    generator_module = load_script("export-generator.py", "export_generator")
+
+    print("%-10s %-28s %10s %12s %12s %12s %12s" % ("size", "phase", "records", "seconds", "records/s", "peak MB", "retained MB"))
+    for size in [int(size) for size in args.sizes.split(",")]:
+        filename = export_for_size(generator_module, args.data_dir, size, args.seed)
+
+        for name, phase in parse_phases(importer, filename, args.workers):
+            timings = []
+            for attempt in range(args.repeat):
+                count, seconds = run_phase(phase, memory=False)
+                timings.append(seconds)
+            seconds = min(timings)
+
+            if args.no_memory:
+                peak = retained = float("nan")
+            else:
+                count, retained, peak = run_phase(phase, memory=True)
+                peak /= 1024.0 * 1024.0
+                retained /= 1024.0 * 1024.0
+
+            print("%-10d %-28s %10d %12.3f %12.0f %12.1f %12.1f" % (size, name, count, seconds, count / seconds if seconds > 0 else 0.0, peak, retained))
+
+
+if __name__ == "__main__":
+    main()
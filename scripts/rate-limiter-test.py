@@ -0,0 +1,94 @@
+import contextlib
+import io
+import os
+import unittest
+from time import monotonic
+
+from script_loader import load_script
+
+#Checks the adaptive rate limiting in joint-importer.py against mock-github-server.py, which sends the same rate limit headers
+#GitHub does: a secondary limit 403 with Retry-After has to pause sending for that long and slow the rate down, the rate has to
+#climb back to its ceiling once requests go through again, and a token out of primary quota has to wait for its reset.
+#
+#To use: python3 rate-limiter-test.py
+
+os.environ.setdefault("GH_TOKEN", "test")
+importer = load_script("joint-importer.py", "joint_importer", quiet=True)
+mock = load_script("mock-github-server.py", "mock_github_server")
+
+
+class Rate_Limiter_Test(unittest.TestCase):
+    max_rate = 50.0
+
+    def start(self, **options):
+        self.server, self.github = mock.start_mock_server(**options)
+        self.addCleanup(self.github.stop)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.limiter = importer.Rate_Limiter(max_rate=self.max_rate, burst=10, secondary_backoff=30)
+        self.rates = [] #the limiter's rate after every response
+
+        update = self.limiter.update
+
+        def recorded_update(response):
+            limited = update(response)
+            self.rates.append(self.limiter.rate)
+            return limited
+
+        self.limiter.update = recorded_update
+        self.transport = importer.GitHub_Transport("test", api_url=self.github.base_url, limiter=self.limiter,
+                                                   retry_policy=importer.Retry_Policy(base_delay=0.01))
+        self.addCleanup(self.transport.close)
+
+    #one request through the transport, which backs off and resends it as often as the limiter says to
+    def send(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.transport.request("GET", "labels", "/labels")
+
+    #sends until the mock refuses a request with a secondary limit - it counts per clock second, so the first few can straddle two
+    #of them - and returns how long the request that was refused took to go through in the end
+    def hit_secondary_limit(self):
+        for attempt in range(20):
+            start = monotonic()
+            self.assertEqual(self.send().status_code, 200)
+            if self.github.rate_limited:
+                return monotonic() - start
+        self.fail("the mock server never sent a secondary limit")
+
+    def test_pauses_for_retry_after(self):
+        self.start(secondary_per_second=3, retry_after=1)
+        elapsed = self.hit_secondary_limit()
+
+        self.assertEqual(self.github.rate_limited, 1) #it was sent again once, after waiting out the Retry-After
+        self.assertGreaterEqual(elapsed, 0.9)
+        self.assertLess(elapsed, 5) #...and not the 30 second backoff kept for limits that don't say how long to wait
+
+    def test_slows_down_on_secondary_limit(self):
+        self.start(secondary_per_second=3, retry_after=1)
+        self.hit_secondary_limit()
+
+        self.assertEqual(min(self.rates), self.max_rate / 2)
+
+    def test_speeds_back_up(self):
+        self.start(secondary_per_second=3, retry_after=1)
+        self.hit_secondary_limit()
+        self.assertLess(self.limiter.rate, self.max_rate)
+
+        self.github.secondary_per_second = 0
+        for attempt in range(15):
+            self.assertEqual(self.send().status_code, 200)
+
+        self.assertEqual(self.limiter.rate, self.max_rate)
+
+    def test_waits_for_quota_reset(self):
+        self.start(quota=3, quota_window=1)
+        start = monotonic()
+        for attempt in range(4):
+            self.assertEqual(self.send().status_code, 200)
+
+        self.assertEqual(self.github.rate_limited, 0) #the token pool saw the quota run out in the headers and waited before sending
+        self.assertGreaterEqual(monotonic() - start, 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import argparse
+import os
+from time import perf_counter
+
+from script_loader import load_script
+
+#Microbenchmark for the body rewrite engine in joint-importer.py: runs every description and note body in the exports through
+#one rewrite per rule (the way bodies used to be fixed up, one scan each) and through the single pass Body_Rewriter, and reports MB/s.
+#
+#To use: python3 rewrite-benchmark.py [--rules fences,mentions,uploads] [export.json ...]
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+export_dir = os.path.join(script_dir, "..", "export")
+
+
+def collect_bodies(importer, filenames):
+    bodies = []
+    for filename in filenames:
+        for key, item in importer.stream_export_records(filename, ("issues", "merge_requests")):
+            bodies.append(str(item['description']))
+            for note in item['notes']:
+                bodies.append(note['note'])
+    return bodies
+
+
+def best_time(function, bodies, repeat):
+    best = None
+    for attempt in range(repeat):
+        start = perf_counter()
+        for body in bodies:
+            function(body)
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-rule body rewriting against the single pass rewrite engine")
+    parser.add_argument("exports", nargs="*", default=[os.path.join(export_dir, "issues.json"), os.path.join(export_dir, "merges-sample.json")])
+    parser.add_argument("--rules", default=None, help="comma separated rule names (default: every rule)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("GH_TOKEN", "benchmark")
+    importer = load_script("joint-importer.py", "joint_importer", quiet=True)
+    rule_names = args.rules.split(",") if args.rules else list(importer.body_rewrite_rules)
+    bodies = collect_bodies(importer, args.exports)
+    megabytes = sum(len(body) for body in bodies) / (1024.0 * 1024.0)
+    print("%d bodies, %.2f MB, rules: %s\n" % (len(bodies), megabytes, ", ".join(rule_names)))
+
+    per_rule = [importer.Body_Rewriter([name]) for name in rule_names]
+
+    def chained(body):
+        for rewriter in per_rule:
+            body = rewriter.rewrite(body)
+        return body
+
+    single = importer.Body_Rewriter(rule_names)
+
+    candidates = [("one pass per rule", chained), ("single pass engine", single.rewrite)]
+    if rule_names == ["fences"]:
+        candidates.insert(0, ("str.replace", lambda body: body.replace("```text", "```")))
+
+    for name, function in candidates:
+        seconds = best_time(function, bodies, args.repeat)
+        print("%-20s %8.1f ms %10.1f MB/s" % (name, seconds * 1000, megabytes / seconds if seconds > 0 else 0.0))
+
+    changed = sum(1 for body in bodies if single.rewrite(body) != body)
+    print("\n%d bodies changed by the rewrite" % changed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import contextlib
+import importlib.util
+import io
+import os
+import sys
+
+#The scripts in here have dashes in their names so they can't be imported normally - this loads one of them as a module instead.
+#Every call gives a separate copy with its own globals, registered in sys.modules under module_name (the parse workers find it there).
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+#quiet hides whatever the script prints while it loads
+def load_script(filename, module_name, quiet=False):
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(script_dir, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    if quiet:
+        with contextlib.redirect_stdout(io.StringIO()):
+            spec.loader.exec_module(module)
+    else:
+        spec.loader.exec_module(module)
+    return module